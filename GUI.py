@@ -1,18 +1,23 @@
 import sys
+import threading
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QLabel,
                              QVBoxLayout, QHBoxLayout, QWidget, QFrame, QComboBox, QFileDialog, QSlider, QMessageBox, QGridLayout)
 from PyQt5.QtCore import Qt, QPropertyAnimation, QRect
 from PyQt5.QtGui import QIcon
-import openpyxl
-import serial 
 from openpyxl.styles import PatternFill
+from workbook import cached_layer_cells
+from preview import LayerBrowser
+from toolpath import plan_toolpath
+from transport import SerialTransport, MANUAL, JOB, stop_report
+from control import DEFAULT_PORT
 
-class IndustrialCncGui(QMainWindow):
+class IndustrialCncGui(LayerBrowser, QMainWindow):
     
     def __init__(self):
         super().__init__()
+        self.load_task = None  # Workbook being parsed on the worker pool
         self.init_ui()
-        self.init_serial('/dev/cu.usbserial-10', 9600)  # Update the port
+        self.init_serial(DEFAULT_PORT, 9600)  # Update the port
         
     def init_ui(self):
         # Setup UI elements
@@ -23,7 +28,9 @@ class IndustrialCncGui(QMainWindow):
         
     def init_serial(self, port, baud_rate):
         try:
-            self.ser = serial.Serial(port, baud_rate)
+            # The transport owns the port, commands are queued to it without blocking the UI
+            # The sketch reads "x,y;" lines and never answers them, so nothing waits for acks
+            self.ser = SerialTransport.open(port, baud_rate, acks=False)
         except Exception as e:
             QMessageBox.critical(self, "Serial Connection Error", f"Failed to connect to the Arduino: {e}")
             self.ser = None
@@ -44,6 +51,7 @@ class IndustrialCncGui(QMainWindow):
         self.layer_preview = QLabel('Layer Preview')
         self.layer_preview.setFixedSize(300, 300)  # Adjust size as needed
         self.layer_preview.setStyleSheet("background-color: gray")
+        self.layer_combobox.currentTextChanged.connect(self.show_layer_preview)
         self.process_button = QPushButton('Process Layer')
         self.process_button.setFixedSize(200, 40)
         self.process_button.setStyleSheet("background-color: green; color: white")
@@ -87,7 +95,7 @@ class IndustrialCncGui(QMainWindow):
         self.stop_button = QPushButton('STOP', self)
         self.stop_button.setFixedSize(200, 100)
         self.stop_button.setStyleSheet("background-color: red; color: white")
-        self.stop_button.clicked.connect(lambda: self.send_to_arduino('STOP'))
+        self.stop_button.clicked.connect(self.emergency_stop)
 
         # Create grid layout for CNC movement controls
         move_grid = QGridLayout()
@@ -273,47 +281,38 @@ class IndustrialCncGui(QMainWindow):
         # Placeholder for function to set home position
         pass
 
-    def load_excel_file(self):
-        # This line uses the QFileDialog.getOpenFileName method to open the file dialog
-        file_name, _ = QFileDialog.getOpenFileName(self, "Open Excel File", "", "Excel Files (*.xlsx)")
-        
-        if file_name:
-            self.excel_file = file_name
-            workbook = openpyxl.load_workbook(self.excel_file)
-            self.sheet_names = workbook.sheetnames
-            self.layer_combobox.clear()
-            self.layer_combobox.addItems(self.sheet_names)  # Use addItems to populate QComboBox
-            print(f"Loaded Excel file: {self.excel_file}")
-
-
     def process_layer(self):
         selected_layer = self.layer_combobox.currentText()
         if not selected_layer or selected_layer == "Select Layer":
             QMessageBox.warning(self, "Layer Selection", "Please select a layer to process.")
             return
         
-        workbook = openpyxl.load_workbook(self.excel_file)
-        sheet = workbook[selected_layer]
-
-        # Assuming the first 20x20 area corresponds to the grid
-        commands = []
-        for row in range(1, 21):  # Adjust range if your grid differs
-            for col in range(1, 21):
-                cell = sheet.cell(row, col)
-                # Check if the cell's fill color is not white (or not transparent)
-                # Assuming that default grid cells have no fill (white/transparent)
-                if cell.fill.start_color.index != '00000000':  # '00000000' corresponds to no fill in openpyxl
-                    commands.append(f"{col-1},{row-1};")  # Subtracting 1 to start coordinates at 0
-
-        # Send commands to Arduino
-        self.send_to_arduino(commands)
+        # Assuming the first 20x20 area corresponds to the grid, adjust the bounds if your grid differs
+        # Filled cells are read straight from the sheet XML instead of checking every cell's fill
+        cells = cached_layer_cells(self.excel_file, selected_layer, max_row=20, max_col=20)
+        # Order the shots to minimize travel between them
+        plan = plan_toolpath(cells)
+        print(plan.report())
+        commands = [f"{x},{y};" for x, y in plan.order]
+
+        # Send commands to Arduino from a background thread, job commands wait while the transport queue is full
+        if self.ser:
+            self.ser.clear_halt()
+        threading.Thread(target=self.send_to_arduino, args=(commands, JOB), daemon=True).start()
         
-    def send_to_arduino(self, commands):
+    def emergency_stop(self):
+        if self.ser and self.ser.isOpen():
+            # Feed hold and reset go out ahead of every queued command
+            stopped = self.ser.emergency_stop()
+            stopped.add_done_callback(lambda f: print(stop_report(f)))
+
+    def send_to_arduino(self, commands, priority=MANUAL):
+        if isinstance(commands, str):  # A single button command
+            commands = [commands]
         if self.ser and self.ser.isOpen():
             for command in commands:
                 print(f"Sending: {command}")
-                self.ser.write(command.encode() + b'\n')  # Ensure newline is added if your Arduino sketch expects it
-                self.ser.flush()  # Ensure data is sent immediately
+                self.ser.send(command, priority)  # The transport adds the newline your Arduino sketch expects
 
 
 def main():
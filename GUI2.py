@@ -1,19 +1,21 @@
 import sys
-import serial
 import openpyxl
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QLabel, QVBoxLayout, QHBoxLayout, QWidget, QComboBox, QFileDialog, QMessageBox)
 from openpyxl.styles import PatternFill
+from transport import SerialTransport, MANUAL
+from control import DEFAULT_PORT
 
 class IndustrialCncGui(QMainWindow):
     
     def __init__(self):
         super().__init__()
-        self.ser = self.init_serial('/dev/cu.usbserial-10', 115200)  # Update the port according to your setup
+        self.ser = self.init_serial(DEFAULT_PORT, 115200)  # Update the port according to your setup
         self.init_ui()
 
     def init_serial(self, port, baud_rate):
         try:
-            ser = serial.Serial(port, baud_rate)
+            # The transport owns the port, commands are queued to it without blocking the UI
+            ser = SerialTransport.open(port, baud_rate)
             print(f"Connected to the Arduino on {port}.")
             return ser
         except Exception as e:
@@ -73,12 +75,10 @@ class IndustrialCncGui(QMainWindow):
     def send_gcode_command(self, command):
         # Sends the G-code command to the Arduino through serial
         if self.ser and self.ser.isOpen():
-            self.ser.write(f"{command}\n".encode('utf-8'))
-            self.ser.flush()
+            future = self.ser.send(command, MANUAL)
             print(f"Sent: {command}")
             # This assumes Arduino sends back a simple OK response for every command sent
-            response = self.ser.readline().decode('utf-8').strip()
-            print(f"Received response: {response}")
+            future.add_done_callback(lambda f: print(f"Received response: {f.result()}"))
         else:
             print("Serial connection is not open.")
 
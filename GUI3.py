@@ -1,23 +1,26 @@
 import sys
-import serial
-import openpyxl
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QLabel,
                              QVBoxLayout, QHBoxLayout, QWidget, QComboBox,
                              QFileDialog, QMessageBox, QGridLayout)
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QIcon
 from openpyxl.styles import PatternFill
+from preview import LayerBrowser
+from transport import SerialTransport, MANUAL
+from control import DEFAULT_PORT
 
-class IndustrialCncGui(QMainWindow):
+class IndustrialCncGui(LayerBrowser, QMainWindow):
 
     def __init__(self):
         super().__init__()
-        self.ser = self.init_serial('/dev/cu.usbserial-10', 115200)  # Adjust the port and baud rate according to your setup
+        self.load_task = None  # Workbook being parsed on the worker pool
+        self.ser = self.init_serial(DEFAULT_PORT, 115200)  # Adjust the port and baud rate according to your setup
         self.init_ui()
 
     def init_serial(self, port, baud_rate):
         try:
-            ser = serial.Serial(port, baud_rate)
+            # The transport owns the port, commands are queued to it without blocking the UI
+            ser = SerialTransport.open(port, baud_rate)
             print(f"Connected to the Arduino on {port}.")
             return ser
         except Exception as e:
@@ -50,6 +53,7 @@ class IndustrialCncGui(QMainWindow):
         self.layer_combobox = QComboBox()
         self.layer_preview = QLabel('Layer Preview')
         self.layer_preview.setFixedSize(300, 300)
+        self.layer_combobox.currentTextChanged.connect(self.show_layer_preview)
         self.process_button = QPushButton('Process Layer')
         self.process_button.setFixedSize(200, 40)
         left_layout.addWidget(self.load_button)
@@ -96,19 +100,9 @@ class IndustrialCncGui(QMainWindow):
 
     def send_gcode_command(self, command):
         if self.ser and self.ser.isOpen():
-            self.ser.write(f"{command}\n".encode('utf-8'))
-            self.ser.flush()
+            self.ser.send(command, MANUAL)
             print(f"Sent: {command}")
 
-    def load_excel_file(self):
-        file_name, _ = QFileDialog.getOpenFileName(self, "Open Excel File", "", "Excel Files (*.xlsx)")
-        if file_name:
-            self.excel_file = file_name
-            workbook = openpyxl.load_workbook(self.excel_file)
-            self.sheet_names = workbook.sheetnames
-            self.layer_combobox.clear()
-            self.layer_combobox.addItems(self.sheet_names)
-
     def style_interface(self):
         self.setStyleSheet("""
         QMainWindow {
@@ -1,19 +1,32 @@
 import sys
 import serial
+import threading
 import time
-import openpyxl
+from concurrent.futures import CancelledError
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QLabel,
-                             QVBoxLayout, QHBoxLayout, QWidget, QFrame, QComboBox, QFileDialog, QMessageBox, QGridLayout)
+                             QVBoxLayout, QHBoxLayout, QWidget, QFrame, QComboBox, QCheckBox, QFileDialog, QMessageBox, QGridLayout)
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QIcon
 from openpyxl.styles import PatternFill
-
-class IndustrialCncGui(QMainWindow):
+from workbook import cached_layer_cells
+from preview import LayerBrowser
+from toolpath import find_runs, plan_runs, plan_toolpath
+from estimate import estimate_runs_time, estimate_toolpath_time, format_duration
+from control import DEFAULT_PORT
+from gcode import SHOOT_COMMAND, burst_block, shot_block, spread_shot_block
+from shot_coverage import plan_coverage
+from tasks import run_machine_task
+from transport import MANUAL, MOTION_TIMEOUT, SerialTransport, stop_report
+
+class IndustrialCncGui(LayerBrowser, QMainWindow):
     
     def __init__(self):
         super().__init__()
+        self.load_task = None  # Workbook being parsed on the worker pool
+        self.job_task = None  # Layer job running on the machine pool
+        self.machine_lock = threading.Lock()  # Manual moves and layer jobs take turns on the machine
         self.init_ui()
-        self.init_serial('/dev/cu.usbserial-10', 115200)  # Update the port
+        self.init_serial(DEFAULT_PORT, 115200)  # Update the port
         self.is_processing = False  # Flag to control processing state
         
     def init_ui(self):
@@ -24,12 +37,13 @@ class IndustrialCncGui(QMainWindow):
         
     def init_serial(self, port, baud_rate):
         try:
-            self.ser = serial.Serial(port, baud_rate)
+            # The transport owns the port, manual commands and layer jobs are both queued to it
+            self.transport = SerialTransport.open(port, baud_rate)
             time.sleep(2)  # Allow time for the connection to initialize
             print(f"Connected to the Arduino on {port}.")
         except serial.SerialException as e:
             QMessageBox.critical(self, "Serial Connection Error", f"Failed to connect to the Arduino: {e}")
-            self.ser = None
+            self.transport = None
 
     def setup_ui_elements(self):
         self.setWindowTitle('Industrial Paintball CNC Controller')
@@ -45,6 +59,9 @@ class IndustrialCncGui(QMainWindow):
         self.layer_preview = QLabel('Layer Preview')
         self.layer_preview.setFixedSize(300, 300)
         self.layer_preview.setStyleSheet("background-color: gray")
+        self.layer_combobox.currentTextChanged.connect(self.show_layer_preview)
+        self.coverage_checkbox = QCheckBox('Coverage Mode (wide shots, needs M300 P firmware)')
+        self.bursts_checkbox = QCheckBox('Burst Mode (needs M301 firmware)')
         self.process_button = QPushButton('Process Layer')
         self.process_button.setFixedSize(200, 40)
         self.process_button.setStyleSheet("background-color: green; color: white")
@@ -52,6 +69,8 @@ class IndustrialCncGui(QMainWindow):
         left_layout.addWidget(self.load_button)
         left_layout.addWidget(self.layer_combobox)
         left_layout.addWidget(self.layer_preview)
+        left_layout.addWidget(self.coverage_checkbox)
+        left_layout.addWidget(self.bursts_checkbox)
         left_layout.addWidget(self.process_button)
 
         self.create_cnc_control_buttons(right_layout)
@@ -91,68 +110,103 @@ class IndustrialCncGui(QMainWindow):
         layout.addWidget(self.left_button)
         layout.addWidget(self.right_button)
 
-    def send_gcode_command(self, command, delay=1):
-        if self.ser and self.ser.isOpen():
-            full_command = f"{command}\n"
-            print(f"Sending: {command}")
-            self.ser.write(full_command.encode('utf-8'))
-            self.ser.flush()
-            response = self.ser.readline().decode('utf-8').strip()
-            print(f"Received response: {response}")
-            time.sleep(delay)  # Delay after sending the command
+    def send_gcode_command(self, command):
+        if self.transport and self.transport.isOpen():
+            # Waiting for the move happens on the machine pool, so the window never freezes
+            task = run_machine_task(self.stream_command, command)
+            task.signals.error.connect(lambda message: QMessageBox.warning(self, "Command Error", message))
         else:
             QMessageBox.warning(self, "Connection Error", "Serial connection is not established.")
 
+    def stream_command(self, task, command):
+        # Task function: send a manual command and return once its motion is complete
+        if self.job_task:
+            raise RuntimeError("A layer is being processed, stop it before moving the machine.")
+        with self.machine_lock:
+            print(f"Sending: {command}")
+            response = self.transport.send(command, MANUAL).result(timeout=MOTION_TIMEOUT)
+            self.transport.sync(MANUAL).result(timeout=MOTION_TIMEOUT)
+            print(f"Received response: {response}")
+
     def mock_shoot_action(self):
         """Simulate shooting action."""
         print("Simulating SHOOT action.")
-        # Use a command suitable for your setup; here's a placeholder
-        self.send_gcode_command("M300 S30", 5)  # Adjust as needed# Simulate the shoot action with a command
+        self.send_gcode_command(SHOOT_COMMAND)  # Simulate the shoot action with a command
     
     def move_home(self):
         """Move the CNC to the origin (0,0) and reset the Z-axis."""
-        self.send_gcode_command("G90\nG0 X0 Y0 Z0", 1)  # Use G90 to ensure absolute positioning
+        self.send_gcode_command("G90\nG0 X0 Y0 Z0")  # Use G90 to ensure absolute positioning
         print("Moved to HOME position.")
 
     def stop_processing(self):
         """Stop the current processing."""
         self.is_processing = False
+        if self.job_task:
+            self.job_task.cancel()
+        if self.transport and self.transport.isOpen():
+            # Feed hold and reset go out ahead of every queued and buffered shot
+            stopped = self.transport.emergency_stop()
+            stopped.add_done_callback(lambda f: print(stop_report(f)))
 
-    def load_excel_file(self):
-        file_name, _ = QFileDialog.getOpenFileName(self, "Open Excel File", "", "Excel Files (*.xlsx)")
-        if file_name:
-            self.excel_file = file_name
-            workbook = openpyxl.load_workbook(file_name)
-            sheet_names = workbook.sheetnames
-            self.layer_combobox.clear()
-            self.layer_combobox.addItems(sheet_names)
-   
     def process_layer(self):
-        self.move_home()  # Ensure starting from the origin for each layer
-        self.is_processing = True
-
         selected_layer = self.layer_combobox.currentText()
-        if not selected_layer or self.ser is None or not self.ser.isOpen():
+        if not selected_layer or self.transport is None or not self.transport.isOpen():
             QMessageBox.warning(self, "Error", "Please select a layer and ensure the device is connected.")
             return
+        if self.job_task:
+            QMessageBox.warning(self, "Error", "A layer is already being processed.")
+            return
 
-        workbook = openpyxl.load_workbook(self.excel_file, read_only=True)
-        sheet = workbook[selected_layer]
-        for row in range(1, 50):
-            for col in range(1, 50):
-                if not self.is_processing:  # Allows for stopping the loop
-                    return
-                cell = sheet.cell(row, col)
-                # Safely check for cell's fill color
-                fill_color = cell.fill.start_color.index if cell.fill and cell.fill.start_color else '00000000'
-                if fill_color == '00000000':  # Skip cells with default fill color
-                    continue
-                else:  # Cells with a fill color other than '00000000'
-                    # Use absolute positioning for each move
-                    self.send_gcode_command(f"G90\nG0 X{col-1} Y{row-1} Z{row-1}", 1)
-                    self.mock_shoot_action()  # Simulate shooting
-
-
+        self.is_processing = True
+        self.transport.clear_halt()
+        # The whole job runs on the machine pool, progress and errors come back as signals
+        self.job_task = run_machine_task(self.run_layer, selected_layer, self.coverage_checkbox.isChecked(),
+                                         self.bursts_checkbox.isChecked())
+        self.job_task.signals.progress.connect(
+            lambda done, total, shot: self.statusBar().showMessage(f"Shot {done}/{total} at {shot}"))
+        self.job_task.signals.error.connect(lambda message: QMessageBox.critical(self, "Job Error", message))
+        self.job_task.signals.result.connect(
+            lambda completed: self.statusBar().showMessage("Layer finished." if completed else "Layer stopped.", 5000))
+        self.job_task.signals.finished.connect(self.layer_finished)
+
+    def run_layer(self, task, selected_layer, coverage, bursts):
+        # Task function: shoot one layer, returns False if it was stopped
+        is_running = lambda: self.is_processing and not task.cancelled
+        with self.machine_lock:
+            # Ensure starting from the origin for each layer, absolute positioning and G0
+            self.transport.send("G90\nG0 X0 Y0 Z0")
+            try:
+                self.transport.sync().result(timeout=MOTION_TIMEOUT)
+            except CancelledError:
+                return False  # Stopped before the first shot
+
+            # Only the filled cells are returned, read straight from the sheet XML
+            cells = cached_layer_cells(self.excel_file, selected_layer, max_row=49, max_col=49)
+            if coverage:
+                # Solid blocks are covered by one wide shot each, single cells are kept along the edges
+                plan = plan_coverage(cells, start=(0, 0))
+                print(plan.report())
+                order, shot_commands = plan.shots, spread_shot_block
+            elif bursts:
+                # Adjacent cells of a row are shot in one traverse, the runs are ordered to minimize travel from home
+                order = plan_runs(find_runs(cells), start=(0, 0))
+                print(f"{len(cells)} shots in {len(order)} bursts, estimated {format_duration(estimate_runs_time(order))}")
+                shot_commands = burst_block
+            else:
+                # Order the shots to minimize travel, starting from the home position
+                plan = plan_toolpath(cells, start=(0, 0))
+                print(plan.report())
+                print(f"Estimated {format_duration(estimate_toolpath_time(plan.order))}")
+                order, shot_commands = plan.order, shot_block
+            # Stream the shots, paced by the controller's acknowledgements instead of fixed delays
+            # The controller is in G90/G0, so each shot only sends its absolute coordinates
+            return self.transport.run_toolpath(order, shot_commands, is_running=is_running,
+                                               on_shot=lambda index, shot: task.report(index + 1, len(order),
+                                                                                       f"X{shot[0]} Y{shot[1]}"))
+
+    def layer_finished(self):
+        self.job_task = None
+        self.is_processing = False
 
     def style_interface(self):
         self.setStyleSheet("""
@@ -1,51 +1,103 @@
 import sys
 import serial
 import time
-import openpyxl
+import threading
 from PyQt5.QtCore import QThread, pyqtSignal
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QLabel, QVBoxLayout, QHBoxLayout, QWidget, QComboBox, QFileDialog, QMessageBox)
+from workbook import cached_layer_cells
+from preview import LayerBrowser, ProgressOverlay
+from progress import ProgressBatcher
+from toolpath import plan_toolpath
+from jobs import plan_job
+from estimate import estimate_job_time, estimate_toolpath_time, format_duration
+from transport import SerialTransport, stop_report
+from control import DEFAULT_PORT
 
 class Worker(QThread):
     update_position = pyqtSignal(str)
+    progress = pyqtSignal(object)  # JobProgress batches, at most PROGRESS_INTERVAL apart
     finished = pyqtSignal()
     error = pyqtSignal(str)
 
-    def __init__(self, serial_port, excel_file, selected_layer):
+    def __init__(self, transport, excel_file, selected_layer):
         super().__init__()
-        self.serial_port = serial_port
+        self.transport = transport
         self.excel_file = excel_file
         self.selected_layer = selected_layer
         self._is_running = True
 
     def run(self):
         try:
-            workbook = openpyxl.load_workbook(self.excel_file, read_only=True)
-            sheet = workbook[self.selected_layer]
-            for row in range(1, 21):
-                for col in range(1, 21):
-                    if not self._is_running:
-                        return
-                    cell = sheet.cell(row, col)
-                    if cell.fill.start_color.index != '00000000':  # Detects non-default fill
-                        command = f"G90\nG0 X{col-1} Y{row-1}\n"
-                        self.serial_port.write(command.encode('utf-8'))
-                        self.serial_port.flush()
-                        time.sleep(1)  # Simulate execution time
-                        self.update_position.emit(f"Moved to X{col-1} Y{row-1}")
-            self.finished.emit()
+            # Only the filled cells are returned, read straight from the sheet XML
+            cells = cached_layer_cells(self.excel_file, self.selected_layer, max_row=20, max_col=20)
+            # Order the shots to minimize travel between them
+            plan = plan_toolpath(cells)
+            self.update_position.emit(f"{plan.report()}, estimated {format_duration(estimate_toolpath_time(plan.order))}")
+            if self.run_toolpath(plan.order, self.selected_layer):
+                self.finished.emit()
         except Exception as e:
             self.error.emit(str(e))
 
+    def run_toolpath(self, order, sheet_name):
+        """Move to every cell of `order`, returns False if the job was stopped."""
+        # Moves are reported in batches, one signal per move would flood the UI at machine speed
+        batcher = ProgressBatcher(sheet_name, len(order), self.progress.emit)
+        try:
+            # Paced by the controller's acknowledgements instead of a fixed delay per move
+            return self.transport.run_toolpath(order, lambda col, row: f"G90\nG0 X{col} Y{row}",
+                                               is_running=lambda: self._is_running,
+                                               on_shot=lambda index, cell: batcher.position_done(cell))
+        finally:
+            batcher.flush()
+
     def stop(self):
         self._is_running = False
 
-class IndustrialCncGui(QMainWindow):
+class JobWorker(Worker):
+    """Runs every color layer of the workbook in one session, pausing for each paint change."""
+    paint_change = pyqtSignal(str)
+
+    def __init__(self, transport, excel_file):
+        super().__init__(transport, excel_file, None)
+        self._resume = threading.Event()
+
+    def run(self):
+        try:
+            # The workbook is read once for the whole job
+            steps = plan_job(self.excel_file, max_row=20, max_col=20)
+            estimates = estimate_job_time(steps)
+            total = sum(seconds for _, seconds in estimates)
+            self.update_position.emit(f"{len(steps)} layers, estimated {format_duration(total)} of machine time")
+            for step, (_, seconds) in zip(steps, estimates):
+                # Wait for the operator to load this layer's paint
+                self._resume.clear()
+                self.paint_change.emit(step.sheet_name)
+                self._resume.wait()
+                if not self._is_running:
+                    return
+                self.update_position.emit(f"Layer {step.sheet_name}: {step.plan.report()}, estimated {format_duration(seconds)}")
+                if not self.run_toolpath(step.plan.order, step.sheet_name):
+                    return
+            self.finished.emit()
+        except Exception as e:
+            self.error.emit(str(e))
+
+    def resume(self):
+        self._resume.set()
+
+    def stop(self):
+        super().stop()
+        self._resume.set()
+
+class IndustrialCncGui(LayerBrowser, QMainWindow):
     
     def __init__(self):
         super().__init__()
+        self.load_task = None  # Workbook being parsed on the worker pool
+        self.overlay = None  # Preview of the running job's layer with the finished cells marked
         self.serial_port = None
         self.init_ui()
-        self.init_serial('/dev/cu.usbserial-10', 115200)  # Update this with your actual port
+        self.init_serial(DEFAULT_PORT, 115200)  # Update this with your actual port
         
     def init_ui(self):
         self.setWindowTitle('Industrial Paintball CNC Controller')
@@ -54,6 +106,7 @@ class IndustrialCncGui(QMainWindow):
         self.load_button = QPushButton('Load Excel File')
         self.layer_combobox = QComboBox()
         self.process_button = QPushButton('Process Layer')
+        self.run_all_button = QPushButton('Run All Layers')
         self.stop_button = QPushButton('STOP')
 
         # Setting up the layout
@@ -61,6 +114,7 @@ class IndustrialCncGui(QMainWindow):
         control_layout.addWidget(self.load_button)
         control_layout.addWidget(self.layer_combobox)
         control_layout.addWidget(self.process_button)
+        control_layout.addWidget(self.run_all_button)
         control_layout.addWidget(self.stop_button)
 
         main_layout = QVBoxLayout()
@@ -69,6 +123,7 @@ class IndustrialCncGui(QMainWindow):
         self.layer_preview = QLabel('Layer Preview')
         self.layer_preview.setStyleSheet("background-color: gray")
         main_layout.addWidget(self.layer_preview)
+        self.layer_combobox.currentTextChanged.connect(self.show_layer_preview)
 
         central_widget = QWidget()
         central_widget.setLayout(main_layout)
@@ -77,40 +132,67 @@ class IndustrialCncGui(QMainWindow):
         # Connect signals to slots
         self.load_button.clicked.connect(self.load_excel_file)
         self.process_button.clicked.connect(self.process_layer)
+        self.run_all_button.clicked.connect(self.run_all_layers)
         self.stop_button.clicked.connect(self.stop_processing)
 
     def init_serial(self, port, baud_rate):
         try:
-            self.serial_port = serial.Serial(port, baud_rate)
+            # The transport owns the port, the UI and the job worker both queue commands to it
+            self.serial_port = SerialTransport.open(port, baud_rate)
             time.sleep(2)  # Allow time for connection to establish
             print(f"Connected to the device on {port}.")
         except serial.SerialException as e:
             QMessageBox.critical(self, "Serial Connection Error", f"Failed to connect: {e}")
 
-    def load_excel_file(self):
-        file_name, _ = QFileDialog.getOpenFileName(self, "Open Excel File", "", "Excel Files (*.xlsx)")
-        if file_name:
-            self.excel_file = file_name
-            workbook = openpyxl.load_workbook(file_name)
-            sheet_names = workbook.sheetnames
-            self.layer_combobox.clear()
-            self.layer_combobox.addItems(sheet_names)
-
     def process_layer(self):
         selected_layer = self.layer_combobox.currentText()
         if not selected_layer or not self.serial_port or not self.serial_port.isOpen():
             QMessageBox.warning(self, "Error", "Please select a layer and ensure the device is connected.")
             return
         
+        self.serial_port.clear_halt()
+        self.overlay = None
         self.worker = Worker(self.serial_port, self.excel_file, selected_layer)
         self.worker.update_position.connect(lambda msg: print(msg))  # Or update the GUI
+        self.worker.progress.connect(self.show_job_progress)
         self.worker.finished.connect(lambda: print("Processing finished"))
         self.worker.error.connect(lambda e: QMessageBox.critical(self, "Error", f"An error occurred: {e}"))
         self.worker.start()
 
+    def run_all_layers(self):
+        if not hasattr(self, 'excel_file') or not self.serial_port or not self.serial_port.isOpen():
+            QMessageBox.warning(self, "Error", "Please load an Excel file and ensure the device is connected.")
+            return
+
+        self.serial_port.clear_halt()
+        self.overlay = None
+        self.worker = JobWorker(self.serial_port, self.excel_file)
+        self.worker.paint_change.connect(self.confirm_paint_change)
+        self.worker.update_position.connect(lambda msg: print(msg))  # Or update the GUI
+        self.worker.progress.connect(self.show_job_progress)
+        self.worker.finished.connect(lambda: print("All layers finished"))
+        self.worker.error.connect(lambda e: QMessageBox.critical(self, "Error", f"An error occurred: {e}"))
+        self.worker.start()
+
+    def show_job_progress(self, progress):
+        self.statusBar().showMessage(progress.report())
+        if self.overlay is None or self.overlay.sheet_name != progress.sheet_name:
+            self.overlay = ProgressOverlay(self.excel_file, progress.sheet_name)
+        self.overlay.add(progress.cells)
+        size = self.layer_preview.size()
+        self.layer_preview.setPixmap(self.overlay.pixmap(size.width(), size.height()))
+
+    def confirm_paint_change(self, sheet_name):
+        QMessageBox.information(self, "Paint Change", f"Load the paint for layer {sheet_name}, then press OK.")
+        self.worker.resume()
+
     def stop_processing(self):
         if hasattr(self, 'worker') and self.worker.isRunning():
             self.worker.stop()
+        if self.serial_port:
+            # Feed hold and reset go out ahead of every queued command
+            stopped = self.serial_port.emergency_stop()
+            stopped.add_done_callback(lambda f: print(stop_report(f)))
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -0,0 +1,164 @@
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from gcode import write_programs
+from jobs import paint_order, plan_layers
+from palette import DITHER_MODES, image_palette, pixel_art, read_palette
+from workbook import hex_color, save_pixel_art
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+# Function to expand directories and glob patterns into a sorted list of image files
+def find_images(inputs):
+    images = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*')
+        for path in glob.glob(pattern):
+            if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS):
+                images.add(os.path.abspath(path))
+    return sorted(images)
+
+# Function to give every image its own output stem. Images sharing a file name are told apart by
+# their path below the folder they have in common, e.g. 'red/logo.png' becomes 'red_logo_png'.
+def output_stems(images):
+    stems = [os.path.splitext(os.path.basename(image))[0] for image in images]
+    counts = {}
+    for stem in stems:
+        counts[stem.lower()] = counts.get(stem.lower(), 0) + 1
+    root = os.path.commonpath([os.path.dirname(image) for image in images]) if images else ''
+    unique, used = {}, set()
+    for image, stem in zip(images, stems):
+        if counts[stem.lower()] > 1:
+            stem = re.sub(r'[\\/.]+', '_', os.path.relpath(image, root))
+        # A renamed stem can still meet another image's own name, a counter settles it
+        candidate, number = stem, 1
+        while candidate.lower() in used:
+            number += 1
+            candidate = f"{stem}_{number}"
+        used.add(candidate.lower())
+        unique[image] = candidate
+    return unique
+
+# Outputs of one image: the workbook path, the folder holding its per-layer G-code and the
+# record of the conversion that wrote them
+def output_paths(stem, output_dir):
+    return (os.path.join(output_dir, f"{stem}.xlsx"), os.path.join(output_dir, f"{stem}_gcode"),
+            os.path.join(output_dir, f"{stem}.json"))
+
+# Function to check whether an image was last converted with the same options and the outputs
+# listed in its record still exist, newer than every file they are made from
+def is_up_to_date(image, sources, record_path, options):
+    try:
+        with open(record_path) as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if not isinstance(record, dict) or record.get('image') != image or record.get('options') != options:
+        return False
+    outputs = record.get('outputs')
+    if not outputs:
+        return False
+    newest_source = max(os.path.getmtime(path) for path in [image] + sources)
+    return all(os.path.exists(path) and os.path.getmtime(path) >= newest_source for path in outputs + [record_path])
+
+# Pool worker: convert one image, returns its progress report, followed by the bytes each G-code layer saves.
+# `options` are the conversion settings, they are stored in the record written next to the outputs.
+def convert_image(image, palette, stem, output_dir, options):
+    started = time.perf_counter()
+    xlsx_path, gcode_dir, record_path = output_paths(stem, output_dir)
+    # A conversion that fails half way must not leave a record behind
+    if os.path.exists(record_path):
+        os.remove(record_path)
+    if options['auto_colors']:
+        # The palette file is the paint inventory, each image gets its own pick from it
+        palette = image_palette(image, options['auto_colors'], inventory=palette)
+    img_indexed = pixel_art(image, palette, (options['width'], options['height']), options['dither'])
+    outputs, written = [], []
+    if options['xlsx']:
+        # Images are already spread over the pool, so each workbook is built in this process
+        save_pixel_art(img_indexed, xlsx_path, processes=1)
+        outputs.append(xlsx_path)
+        written.append(os.path.basename(xlsx_path))
+    if options['gcode']:
+        # Layers of an earlier conversion may not exist any more, their programs are removed
+        if os.path.isdir(gcode_dir):
+            for name in os.listdir(gcode_dir):
+                if name.endswith('.gcode'):
+                    os.remove(os.path.join(gcode_dir, name))
+        names = [hex_color(color) for color in img_indexed.palette]
+        layers = dict(zip(names, img_indexed.layer_cells()))
+        programs = write_programs(plan_layers(layers, paint_order(names)), stem, gcode_dir,
+                                  bursts=options['bursts'], relative=options['relative'])
+        outputs.extend(program_path for _, program_path, _ in programs)
+        written.append(f"{len(programs)} G-code layers")
+    with open(record_path, 'w') as f:
+        json.dump({'image': image, 'options': options, 'outputs': outputs}, f, indent=2)
+    report = f"{', '.join(written)} ({time.perf_counter() - started:.1f}s)"
+    if options['gcode']:
+        report += ''.join(f"\n    {sheet_name}: {program.report()}" for sheet_name, _, program in programs)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert images to paintball CNC layer workbooks and G-code.")
+    parser.add_argument('inputs', nargs='+', help="Image files, directories or glob patterns such as 'designs/*.png'")
+    parser.add_argument('--palette', required=True, help="Palette file, one color per line as #RRGGBB")
+    parser.add_argument('--auto-colors', type=int, help="Pick this many colors per image, snapped to the palette file's paints")
+    parser.add_argument('--width', type=int, default=50, help="Grid width in cells")
+    parser.add_argument('--height', type=int, default=50, help="Grid height in cells")
+    parser.add_argument('--dither', choices=[mode for mode in DITHER_MODES if mode], help="Dither instead of snapping colors")
+    parser.add_argument('--output', default='.', help="Directory the outputs are written to")
+    parser.add_argument('--xlsx', action='store_true', help="Write the layer workbook (default when --gcode is not given)")
+    parser.add_argument('--gcode', action='store_true', help="Write one G-code program per color layer")
+    parser.add_argument('--bursts', action='store_true', help="Shoot horizontal runs as bursts in the G-code")
+    parser.add_argument('--relative', action='store_true', help="Allow relative moves where they are shorter")
+    parser.add_argument('--jobs', type=int, default=None, help="Worker processes, defaults to the number of cores")
+    parser.add_argument('--force', action='store_true', help="Convert even when the outputs are up to date")
+    args = parser.parse_args(argv)
+
+    write_xlsx = args.xlsx or not args.gcode
+    palette = read_palette(args.palette)
+    images = find_images(args.inputs)
+    if not images:
+        parser.error("no images found")
+    os.makedirs(args.output, exist_ok=True)
+
+    # Everything the outputs depend on besides the files themselves
+    options = {
+        'palette': os.path.abspath(args.palette), 'auto_colors': args.auto_colors,
+        'width': args.width, 'height': args.height, 'dither': args.dither,
+        'xlsx': write_xlsx, 'gcode': args.gcode, 'bursts': args.bursts, 'relative': args.relative,
+    }
+    stems = output_stems(images)
+    pending = []
+    for image in images:
+        record_path = output_paths(stems[image], args.output)[2]
+        if not args.force and is_up_to_date(image, [args.palette], record_path, options):
+            print(f"Up to date: {os.path.basename(image)}")
+            continue
+        pending.append(image)
+
+    failures = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(args.jobs) as pool:
+        futures = {pool.submit(convert_image, image, palette, stems[image], args.output, options): image
+                   for image in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            name = os.path.basename(futures[future])
+            try:
+                print(f"[{done}/{len(pending)}] {name}: {future.result()}")
+            except Exception as e:
+                failures += 1
+                print(f"[{done}/{len(pending)}] {name}: failed, {e}", file=sys.stderr)
+    print(f"Converted {len(pending) - failures} of {len(images)} images in {time.perf_counter() - started:.1f}s, "
+          f"{len(images) - len(pending)} up to date, {failures} failed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
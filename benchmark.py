@@ -0,0 +1,90 @@
+import argparse
+import random
+import statistics
+import time
+
+from emulator import ControllerEmulator
+from estimate import estimate_toolpath_time, format_duration
+from gcode import shot_block
+from machine import MachineProfile
+from toolpath import plan_toolpath
+from transport import STOP_TIMEOUT, SerialTransport
+
+# Function to pick `count` distinct cells of a width x height grid, the same cells for the same seed
+def random_layer(count, width=50, height=50, seed=0):
+    cells = [(x, y) for y in range(height) for x in range(width)]
+    return random.Random(seed).sample(cells, min(count, len(cells)))
+
+# Function to shoot a layer on an emulated controller through the shared transport.
+# Returns the measurements: shots fired, lines and bytes sent, wall-clock and emulated machine
+# seconds, and the estimator's prediction for the same toolpath.
+def run_job(cells, profile=None, time_scale=0.01):
+    profile = profile or MachineProfile()
+    emulator = ControllerEmulator(profile, time_scale=time_scale)
+    transport = SerialTransport.open(emulator.start(), 115200)
+    try:
+        plan = plan_toolpath(cells)
+        transport.send("G90\nG0 X0 Y0 Z0")
+        transport.sync().result()
+        emulator.busy_time = 0.0
+        lines = emulator.lines
+        started = time.perf_counter()
+        completed = transport.run_toolpath(plan.order, shot_block, retries=0)
+        wall = time.perf_counter() - started
+        return {
+            'completed': completed,
+            'shots': list(emulator.shots),
+            'lines': emulator.lines - lines,
+            'bytes': sum(len(shot_block(*cell)) + 1 for cell in plan.order),  # Every line ends with a newline
+            'wall': wall,
+            'machine': emulator.busy_time,
+            'estimate': estimate_toolpath_time(plan.order, profile),
+            'overflows': emulator.overflows,
+        }
+    finally:
+        transport.close()
+        emulator.stop()
+
+# Function to press the emergency stop `repeats` times while the emulated machine is moving,
+# returns the stop latencies in seconds as measured by the transport
+def measure_stop_latency(repeats=10, profile=None):
+    emulator = ControllerEmulator(profile or MachineProfile())
+    transport = SerialTransport.open(emulator.start(), 115200)
+    latencies = []
+    try:
+        for _ in range(repeats):
+            transport.clear_halt()
+            transport.send("G90\nG0 X0 Y0 Z0")
+            transport.sync().result()
+            for x in range(100, 1000, 100):
+                transport.send(f"G0 X{x}")
+            deadline = time.monotonic() + STOP_TIMEOUT
+            while not (emulator.moving and emulator.planner) and time.monotonic() < deadline:
+                time.sleep(0.005)
+            latencies.append(transport.emergency_stop().result(timeout=STOP_TIMEOUT))
+        return latencies
+    finally:
+        transport.close()
+        emulator.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the job path against the emulated controller.")
+    parser.add_argument('--cells', type=int, default=400, help="Cells in the test layer")
+    parser.add_argument('--time-scale', type=float, default=0.01, help="Multiplier applied to every emulated delay")
+    parser.add_argument('--stops', type=int, default=10, help="Emergency stops to time")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random test layer")
+    args = parser.parse_args()
+
+    result = run_job(random_layer(args.cells, seed=args.seed), time_scale=args.time_scale)
+    print(f"Job: {len(result['shots'])} shots, {result['lines']} lines, {result['bytes']} bytes in {result['wall']:.2f}s "
+          f"({result['lines'] / result['wall']:.0f} lines/s, {result['overflows']} buffer overflows)")
+    error = (result['machine'] - result['estimate']) / result['estimate'] if result['estimate'] else 0.0
+    print(f"Machine time: {format_duration(result['machine'])} emulated, "
+          f"{format_duration(result['estimate'])} estimated ({error:+.1%})")
+    if args.stops:
+        latencies = sorted(measure_stop_latency(args.stops))
+        print(f"Stop latency over {len(latencies)} stops: median {statistics.median(latencies) * 1000:.1f} ms, "
+              f"max {latencies[-1] * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
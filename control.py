@@ -1,22 +1,26 @@
+import os
 import serial
 import time
 
+from transport import ACK_TIMEOUT, MANUAL, SerialTransport
+
+# Serial port of the controller, point PAINTBALL_CNC_PORT at the emulator's port to run without the Arduino
+DEFAULT_PORT = os.environ.get('PAINTBALL_CNC_PORT', '/dev/cu.usbserial-10')
+
 def open_serial(port, baud_rate):
     try:
-        ser = serial.Serial(port, baud_rate)
+        transport = SerialTransport.open(port, baud_rate)
         time.sleep(2)  # Allow time for the connection to initialize
         print(f"Connected to the Arduino on {port}.")
-        return ser
+        return transport
     except serial.SerialException as e:
         print(f"Error opening serial port {port}: {e}")
         return None
 
-def send_gcode_command(ser, command):
-    full_command = f"{command}\n"
-    ser.write(full_command.encode('utf-8'))
-    ser.flush()
+def send_gcode_command(transport, command):
+    future = transport.send(command, MANUAL)
     print(f"Sent: {command}")
-    response = ser.readline().decode('utf-8').strip()
+    response = future.result(timeout=ACK_TIMEOUT)
     print(f"Received response: {response}")
 
 def main_menu():
@@ -28,32 +32,32 @@ def main_menu():
     print("5 - Quit")
     return input("Choose an option: ")
 
-def perform_action(ser, choice):
+def perform_action(transport, choice):
     if choice == '1':
-        send_gcode_command(ser, "G91")  # Relative positioning
-        send_gcode_command(ser, "G0 X10")  # Move X-axis motor 10 units to the right
+        send_gcode_command(transport, "G91")  # Relative positioning
+        send_gcode_command(transport, "G0 X10")  # Move X-axis motor 10 units to the right
     elif choice == '2':
-        send_gcode_command(ser, "G91")  # Relative positioning
-        send_gcode_command(ser, "G0 X-10")  # Move X-axis motor 10 units to the left
+        send_gcode_command(transport, "G91")  # Relative positioning
+        send_gcode_command(transport, "G0 X-10")  # Move X-axis motor 10 units to the left
     elif choice == '3':
-        send_gcode_command(ser, "G91")  # Relative positioning
-        send_gcode_command(ser, "G0 Y10 Z10")  # Move X-axis motor 10 units to the right
+        send_gcode_command(transport, "G91")  # Relative positioning
+        send_gcode_command(transport, "G0 Y10 Z10")  # Move X-axis motor 10 units to the right
     elif choice == '4':
-        send_gcode_command(ser, "G91")  # Relative positioning
-        send_gcode_command(ser, "G0 Y-10 Z-10")  # Move X-axis motor 10 units to the right
+        send_gcode_command(transport, "G91")  # Relative positioning
+        send_gcode_command(transport, "G0 Y-10 Z-10")  # Move X-axis motor 10 units to the right
     elif choice == '5':
         print("Exiting program.")
     else:
         print("Invalid option. Please try again.")
 
 if __name__ == "__main__":
-    port = input("Enter the Arduino serial port (e.g., COM3 or /dev/ttyACM0): ") #/dev/cu.usbserial-10
+    port = input(f"Enter the Arduino serial port (e.g., COM3 or /dev/ttyACM0, default {DEFAULT_PORT}): ") or DEFAULT_PORT
     baud_rate = 115200
-    ser = open_serial(port, baud_rate)
-    if ser:
+    transport = open_serial(port, baud_rate)
+    if transport:
         while True:
             user_choice = main_menu()
             if user_choice == '5':
                 break
-            perform_action(ser, user_choice)
-        ser.close()  # Close the serial connection when done
+            perform_action(transport, user_choice)
+        transport.close()  # Close the serial connection when done
@@ -1,32 +1,10 @@
 import tkinter as tk
 from tkinter import filedialog, colorchooser, messagebox
-from PIL import Image
-import openpyxl
-from openpyxl.styles import PatternFill
-from openpyxl.utils import get_column_letter
-
-# Function to convert an RGB value into an Excel fill color
-def rgb_to_fill(rgb):
-    return PatternFill(start_color=rgb, end_color=rgb, fill_type='solid')
-
-# Function to map image colors to a predefined palette
-def map_colors(img, palette):
-    # Convert the image to RGB if it's not already in RGB mode
-    img = img.convert('RGB')
-    
-    # Create a new image with the same size as the original to apply the palette mapping
-    new_img = Image.new('RGB', img.size)
-    
-    for x in range(img.size[0]):
-        for y in range(img.size[1]):
-            # Get the current pixel color
-            current_color = img.getpixel((x, y))
-            # Find the nearest color from the palette
-            nearest_color = min(palette, key=lambda color: sum((s - q) ** 2 for s, q in zip(color, current_color)))
-            # Set the pixel to the nearest color
-            new_img.putpixel((x, y), nearest_color)
-    
-    return new_img
+from palette import image_palette, pixel_art, read_palette
+from workbook import save_pixel_art
+
+# Dithering options shown in the window, mapped to palette.quantize modes
+DITHER_CHOICES = {'None': None, 'Floyd-Steinberg': 'floyd-steinberg', 'Bayer': 'bayer'}
 
 # GUI Functions
 def upload_image():
@@ -48,6 +26,34 @@ def add_color_entry():
     color_picker_btn.pack(side=tk.LEFT)
     color_entries.append(color_entry)
 
+# Function to load the paint colors on hand, automatic palettes are snapped to them
+def load_inventory():
+    global inventory
+    path = filedialog.askopenfilename(filetypes=[("Palette files", "*.txt *.hex *.gpl"), ("All files", "*.*")])
+    if path:
+        try:
+            inventory = read_palette(path)
+            inventory_label.config(text=f"Inventory: {len(inventory)} paints")
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+
+# Function to pick the palette from the loaded image and fill the color entries with it,
+# snapped to the paint inventory when one is loaded
+def auto_palette():
+    if not img_path:
+        messagebox.showerror("Error", "Upload an image first")
+        return
+    try:
+        colors = image_palette(img_path, int(auto_count_entry.get()), inventory=inventory)
+        while len(color_entries) < len(colors):
+            add_color_entry()
+        for i, entry in enumerate(color_entries):
+            entry.delete(0, tk.END)
+            if i < len(colors):
+                entry.insert(0, '#%02x%02x%02x' % colors[i])
+    except Exception as e:
+        messagebox.showerror("Error", str(e))
+
 def generate_pixel_art():
     try:
         # Retrieve the selected colors and dimensions from the GUI
@@ -55,88 +61,82 @@ def generate_pixel_art():
         colors_rgb = [tuple(int(hex_color[i:i+2], 16) for i in (1, 3, 5)) for hex_color in color_entries_hex]
 
         # Load and process the image, ensuring no alpha channel
-        img = Image.open(img_path).convert('RGB')
         max_size = (int(width_entry.get()), int(height_entry.get()))
-        img = img.resize(max_size, Image.Resampling.NEAREST)
-        img_mapped = map_colors(img, colors_rgb)
-
-        # Create a new Excel workbook for the color-mapped pixel art
-        wb_mapped_palette = openpyxl.Workbook()
-        complete_sheet = wb_mapped_palette.active
-        complete_sheet.title = "Complete Image"
-
-        # Fill in the complete image sheet with all layers combined
-        for x in range(1, img_mapped.size[0] + 1):
-            for y in range(1, img_mapped.size[1] + 1):
-                pixel = img_mapped.getpixel((x - 1, y - 1))
-                hex_color = ''.join([f'{value:02X}' for value in pixel])
-                cell = complete_sheet.cell(row=y, column=x)
-                cell.fill = rgb_to_fill(hex_color)
-                complete_sheet.column_dimensions[get_column_letter(x)].width = 3
-                complete_sheet.row_dimensions[y].height = 20
-
-        # Generate a layer for each color
-        for color in colors_rgb:
-            hex_color = ''.join([f'{value:02X}' for value in color])
-            ws = wb_mapped_palette.create_sheet(title=hex_color)
-            for x in range(1, img_mapped.size[0] + 1):
-                for y in range(1, img_mapped.size[1] + 1):
-                    pixel = img_mapped.getpixel((x - 1, y - 1))
-                    if pixel == color:  # Only fill the cell if it matches the layer's color
-                        cell = ws.cell(row=y, column=x)
-                        cell.fill = rgb_to_fill(hex_color)
-                    ws.column_dimensions[get_column_letter(x)].width = 3
-                    ws.row_dimensions[y].height = 20
-        
-        # Save the color-mapped Excel file
+        img_indexed = pixel_art(img_path, colors_rgb, max_size, DITHER_CHOICES[dither_var.get()])
+
+        # Save the color-mapped Excel file, streaming each sheet straight to disk
         output_file_path_mapped_palette = filedialog.asksaveasfilename(defaultextension=".xlsx",
                                                                       filetypes=[("Excel files", "*.xlsx")])
         if output_file_path_mapped_palette:
-            wb_mapped_palette.save(output_file_path_mapped_palette)
+            save_pixel_art(img_indexed, output_file_path_mapped_palette)
             messagebox.showinfo("Success", "Pixel Art saved as " + output_file_path_mapped_palette)
     except Exception as e:
         messagebox.showerror("Error", str(e))
 
-# Set up the main application window
-app = tk.Tk()
-app.title("Pixel Art Generator")
-
-# Layout
-frame = tk.Frame(app)
-frame.pack(padx=10, pady=10)
-
-image_label = tk.Label(frame, text="No image selected")
-image_label.pack()
-
-upload_btn = tk.Button(frame, text="Upload Image", command=upload_image)
-upload_btn.pack()
-
-# List to store color entry widgets
-color_entries = []
-
-# Add default three color entries
-for _ in range(3):
-    add_color_entry()
-
-# Button to add more color entries
-add_color_btn = tk.Button(frame, text="Add Another Color", command=add_color_entry)
-add_color_btn.pack()
-
-# Entry for dimensions
-width_label = tk.Label(frame, text="Width:")
-width_label.pack(side=tk.LEFT)
-width_entry = tk.Entry(frame, width=5)
-width_entry.pack(side=tk.LEFT)
-width_entry.insert(0, "50")  # Default value
-
-height_label = tk.Label(frame, text="Height:")
-height_label.pack(side=tk.LEFT)
-height_entry = tk.Entry(frame, width=5)
-height_entry.pack(side=tk.LEFT)
-height_entry.insert(0, "50")  # Default value
-
-# Button to generate pixel art
-generate_btn = tk.Button(frame, text="Generate Pixel Art", command=generate_pixel_art)
-generate_btn.pack()
-
-app.mainloop()
+# The window is only built when run as a script: export worker processes import this module too
+if __name__ == "__main__":
+    # Set up the main application window
+    app = tk.Tk()
+    app.title("Pixel Art Generator")
+
+    # Layout
+    frame = tk.Frame(app)
+    frame.pack(padx=10, pady=10)
+
+    img_path = None
+    image_label = tk.Label(frame, text="No image selected")
+    image_label.pack()
+
+    upload_btn = tk.Button(frame, text="Upload Image", command=upload_image)
+    upload_btn.pack()
+
+    # List to store color entry widgets
+    color_entries = []
+
+    # Add default three color entries
+    for _ in range(3):
+        add_color_entry()
+
+    # Button to add more color entries
+    add_color_btn = tk.Button(frame, text="Add Another Color", command=add_color_entry)
+    add_color_btn.pack()
+
+    # Automatic palette: the most representative colors of the image, or of the paints on hand
+    inventory = None
+    auto_count_label = tk.Label(frame, text="Colors:")
+    auto_count_label.pack(side=tk.LEFT)
+    auto_count_entry = tk.Entry(frame, width=3)
+    auto_count_entry.pack(side=tk.LEFT)
+    auto_count_entry.insert(0, "3")  # Default value
+    auto_palette_btn = tk.Button(frame, text="Auto Palette", command=auto_palette)
+    auto_palette_btn.pack(side=tk.LEFT)
+    inventory_btn = tk.Button(frame, text="Load Paint Inventory", command=load_inventory)
+    inventory_btn.pack(side=tk.LEFT)
+    inventory_label = tk.Label(frame, text="Inventory: none")
+    inventory_label.pack(side=tk.LEFT)
+
+    # Entry for dimensions
+    width_label = tk.Label(frame, text="Width:")
+    width_label.pack(side=tk.LEFT)
+    width_entry = tk.Entry(frame, width=5)
+    width_entry.pack(side=tk.LEFT)
+    width_entry.insert(0, "50")  # Default value
+
+    height_label = tk.Label(frame, text="Height:")
+    height_label.pack(side=tk.LEFT)
+    height_entry = tk.Entry(frame, width=5)
+    height_entry.pack(side=tk.LEFT)
+    height_entry.insert(0, "50")  # Default value
+
+    # Dithering trades hard color bands for a pattern of the available paints
+    dither_label = tk.Label(frame, text="Dithering:")
+    dither_label.pack(side=tk.LEFT)
+    dither_var = tk.StringVar(value='None')
+    dither_menu = tk.OptionMenu(frame, dither_var, *DITHER_CHOICES)
+    dither_menu.pack(side=tk.LEFT)
+
+    # Button to generate pixel art
+    generate_btn = tk.Button(frame, text="Generate Pixel Art", command=generate_pixel_art)
+    generate_btn.pack()
+
+    app.mainloop()
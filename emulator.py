@@ -0,0 +1,300 @@
+import argparse
+import math
+import os
+import pty
+import re
+import threading
+import time
+import tty
+from collections import deque
+
+from machine import AXES, MachineProfile
+from transport import FEED_HOLD, RX_BUFFER_SIZE, SOFT_RESET
+
+# Moves the emulated controller can hold in its motion planner
+PLANNER_SIZE = 16
+
+WELCOME = "Grbl 1.1h ['$' for help]"
+UNLOCK_HINT = "[MSG:'$H'|'$X' to unlock]"
+STATUS_QUERY = b'?'
+CYCLE_START = b'~'
+
+WORD = re.compile(r'([A-Z])\s*([-+]?\d*\.?\d+)')
+
+class ControllerEmulator:
+    """Software stand-in for the Arduino, reachable as a serial port through a pseudo-terminal.
+
+    Speaks the same dialect as the real controller: G90/G91, G0/G1 with X/Y/Z/F,
+    G4 dwell, M300 shots, M301 X.. P.. bursts, `ok`/`error:N` acks and the real-time bytes `?`, `!`,
+    `~` and soft reset. A reset during motion leaves it in ALARM, rejecting G-code until `$X`.
+    Moves take as long as `profile` says they would on the machine, multiplied by `time_scale`
+    so CI runs can go faster than real time.
+    """
+
+    def __init__(self, profile=None, buffer_size=RX_BUFFER_SIZE, planner_size=PLANNER_SIZE, time_scale=1.0):
+        self.profile = profile or MachineProfile()
+        self.buffer_size = buffer_size
+        self.planner_size = planner_size
+        self.time_scale = time_scale
+        self.port = None
+
+        self.rx = bytearray()  # Received bytes the parser has not consumed yet
+        self.planner = deque()  # (kind, value) blocks waiting for the motion thread
+        self.position = [0.0, 0.0, 0.0]
+        self.planned = [0.0, 0.0, 0.0]  # Where the machine ends up once every planned move has run
+        self.absolute = True
+        self.motion = 0  # Modal G0/G1
+        self.feed = None
+        self.holding = False
+        self.alarm = False  # Set by a reset during motion, cleared by $X
+        self.moving = False
+        self._move = None  # (start, target, started at, wall-clock seconds) of the move being run
+        self._generation = 0  # Bumped by every reset, work started before it is dropped
+
+        # Counters that benchmarks and tests can read
+        self.lines = 0
+        self.shots = []  # (x, y, z) of every shot fired
+        self.overflows = 0  # Times the sender put more bytes in flight than the receive buffer holds
+        self.busy_time = 0.0  # Seconds of emulated motion and dwell
+
+        self._lock = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._running = False
+
+    def start(self):
+        """Open the pseudo-terminal and start emulating, returns the port path for serial.Serial."""
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._running = True
+        for target in (self._read_loop, self._parse_loop, self._motion_loop):
+            threading.Thread(target=target, daemon=True).start()
+        return self.port
+
+    def stop(self):
+        self._running = False
+        with self._lock:
+            self._lock.notify_all()
+        os.close(self._slave)
+        os.close(self._master)
+
+    def _reply(self, text):
+        with self._write_lock:
+            os.write(self._master, f"{text}\r\n".encode('utf-8'))
+
+    def _read_loop(self):
+        while self._running:
+            try:
+                data = os.read(self._master, 1024)
+            except OSError:
+                return
+            with self._lock:
+                for byte in data:
+                    byte = bytes([byte])
+                    # Real-time bytes act immediately and never enter the receive buffer
+                    if byte == STATUS_QUERY:
+                        self._reply(self._status())
+                    elif byte == FEED_HOLD:
+                        self.holding = True
+                    elif byte == CYCLE_START:
+                        self.holding = False
+                    elif byte == SOFT_RESET:
+                        self._reset()
+                    else:
+                        self.rx += byte
+                if len(self.rx) > self.buffer_size:
+                    self.overflows += 1
+                self._lock.notify_all()
+
+    def _reset(self):
+        # Like GRBL, stopping the steppers mid-move loses the position, so motion is locked until $X
+        interrupted = self.moving or bool(self.planner)
+        self._generation += 1
+        self.rx.clear()
+        self.planner.clear()
+        if self._move:
+            # The machine stops where it is, part way along the move being run
+            start, target, started, duration = self._move
+            done = min(1.0, (time.monotonic() - started) / duration) if duration else 1.0
+            self.position = [s + (t - s) * done for s, t in zip(start, target)]
+        self.planned = list(self.position)
+        self.holding = False
+        self.absolute = True
+        self.motion = 0
+        if interrupted:
+            self.alarm = True
+            self._reply('ALARM:3')
+        self._reply('')
+        self._reply(WELCOME)
+        if self.alarm:
+            self._reply(UNLOCK_HINT)
+
+    def _status(self):
+        state = 'Alarm' if self.alarm else 'Hold' if self.holding else 'Run' if self.moving or self.planner else 'Idle'
+        position = ','.join(f'{value:.3f}' for value in self.position)
+        free = self.planner_size - len(self.planner)
+        return f"<{state}|MPos:{position}|Bf:{free},{self.buffer_size - len(self.rx)}>"
+
+    def _parse_loop(self):
+        while self._running:
+            with self._lock:
+                # A line is only taken once the planner has room for it, like the real firmware
+                self._lock.wait_for(lambda: not self._running or
+                                    (b'\n' in self.rx and len(self.planner) < self.planner_size))
+                if not self._running:
+                    return
+                end = self.rx.index(b'\n')
+                line = self.rx[:end].decode('utf-8', errors='replace')
+                del self.rx[:end + 1]
+                generation = self._generation
+            self.lines += 1
+            response = self._execute(line, generation)
+            with self._lock:
+                # A reset while the line was being run drops its ack, nothing follows the reset banner
+                if generation == self._generation:
+                    self._reply(response)
+
+    def _execute(self, line, generation):
+        line = re.sub(r'\(.*?\)|;.*', '', line).strip().upper()
+        if not line:
+            return 'ok'
+        if line.startswith('$'):
+            if line != '$X':
+                return 'error:3'  # Unsupported system command
+            with self._lock:
+                if generation == self._generation:
+                    self.alarm = False
+                    self._reply('[MSG:Caution: Unlocked]')
+            return 'ok'
+        if self.alarm:
+            return 'error:9'  # G-code locked out during alarm
+        words = WORD.findall(line)
+        if not words or WORD.sub('', line).strip():
+            return 'error:1'  # Expected command letter
+        params = {letter: float(value) for letter, value in words if letter not in 'GM'}
+        g_codes = [float(value) for letter, value in words if letter == 'G']
+        m_codes = [float(value) for letter, value in words if letter == 'M']
+        has_axes = any(axis in params for axis in AXES)
+        if not g_codes and not m_codes and not has_axes or any(code not in (0, 1, 4, 90, 91) for code in g_codes) \
+                or any(code not in (300, 301) for code in m_codes):
+            return 'error:20'  # Unsupported command
+
+        if 4 in g_codes:
+            self._dwell(params.get('P', 0), generation)
+        with self._lock:
+            # State changes and queued blocks of a line cut short by a reset are dropped with it
+            if generation != self._generation:
+                return None
+            if 'F' in params:
+                self.feed = params['F']
+            # Modal distance mode first, so "G91 G0 X10" moves relative
+            for code in g_codes:
+                if code in (90, 91):
+                    self.absolute = code == 90
+            for code in g_codes:
+                if code in (0, 1):
+                    self.motion = code
+            # Axis words without G0/G1 reuse the last motion mode, as "X3 Y4 Z4" after "G0 X1"
+            if has_axes and 4 not in g_codes:
+                if 301 in m_codes:
+                    # Burst: shoot here, then every P units along the move
+                    self._queue_move(params, rapid=True, pitch=params.get('P', 1.0))
+                else:
+                    self._queue_move(params, rapid=self.motion == 0)
+            for code in m_codes:
+                if code == 300 or not has_axes:
+                    self._queue(('shot', self.profile.shot_dwell))
+        return 'ok'
+
+    def _queue_move(self, params, rapid, pitch=None):
+        with self._lock:
+            target = list(self.planned)
+            for i, axis in enumerate(AXES):
+                if axis in params:
+                    target[i] = params[axis] if self.absolute else target[i] + params[axis]
+            self.planned = target
+            if pitch:
+                self._queue(('burst', target, pitch))
+            else:
+                self._queue(('move', target, None if rapid else self.feed))
+
+    def _queue(self, block):
+        with self._lock:
+            self.planner.append(block)
+            self._lock.notify_all()
+
+    def _dwell(self, seconds, generation):
+        # G4 waits for every planned move to finish before dwelling, so its ack means motion complete
+        with self._lock:
+            self._lock.wait_for(lambda: not self._running or (not self.planner and not self.moving))
+        self._sleep(seconds, generation)
+
+    def _sleep(self, seconds, generation):
+        # Wait out `seconds` of machine time, returns False if a reset cut it short
+        started = time.monotonic()
+        with self._lock:
+            interrupted = self._lock.wait_for(lambda: not self._running or generation != self._generation,
+                                              seconds * self.time_scale)
+        self.busy_time += (time.monotonic() - started) / self.time_scale if interrupted else seconds
+        return not interrupted
+
+    def _motion_loop(self):
+        while self._running:
+            with self._lock:
+                self._lock.wait_for(lambda: not self._running or (self.planner and not self.holding))
+                if not self._running:
+                    return
+                block = self.planner.popleft()
+                generation = self._generation
+                self.moving = True
+                if block[0] == 'move':
+                    duration = self.profile.move_time([t - p for t, p in zip(block[1], self.position)], block[2])
+                elif block[0] == 'burst':
+                    duration = self.profile.burst_time([t - p for t, p in zip(block[1], self.position)], block[2])
+                else:
+                    duration = block[1]
+                if block[0] in ('move', 'burst'):
+                    self._move = (list(self.position), block[1], time.monotonic(), duration * self.time_scale)
+                self._lock.notify_all()
+            completed = self._sleep(duration, generation)
+            with self._lock:
+                # A block cut short by a reset fires no shots, the reset has set where the machine stopped
+                if completed and generation == self._generation:
+                    if block[0] == 'burst':
+                        start, target, pitch = self.position, block[1], block[2]
+                        delta = [t - p for t, p in zip(target, start)]
+                        count = int(round(math.sqrt(sum(d * d for d in delta)) / pitch))
+                        for k in range(count + 1):
+                            self.shots.append(tuple(p + d * k / max(count, 1) for p, d in zip(start, delta)))
+                    if block[0] in ('move', 'burst'):
+                        self.position = list(block[1])
+                    else:
+                        self.shots.append(tuple(self.position))
+                self.moving = False
+                self._move = None
+                self._lock.notify_all()
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate the paintball CNC controller on a pseudo-terminal.")
+    parser.add_argument('--feed', type=float, default=3000.0, help="Max feed rate of every axis, units/min")
+    parser.add_argument('--acceleration', type=float, default=200.0, help="Acceleration of every axis, units/s^2")
+    parser.add_argument('--shot-dwell', type=float, default=0.3, help="Seconds per shot")
+    parser.add_argument('--buffer-size', type=int, default=RX_BUFFER_SIZE, help="Receive buffer size in bytes")
+    parser.add_argument('--time-scale', type=float, default=1.0, help="Multiplier applied to every emulated delay")
+    args = parser.parse_args()
+
+    profile = MachineProfile((args.feed,) * 3, (args.acceleration,) * 3, args.shot_dwell)
+    emulator = ControllerEmulator(profile, args.buffer_size, time_scale=args.time_scale)
+    port = emulator.start()
+    print(f"Emulated controller listening on {port}")
+    print(f"Run a front end against it with PAINTBALL_CNC_PORT={port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"Lines: {emulator.lines}, shots: {len(emulator.shots)}, overflows: {emulator.overflows}, "
+              f"machine time: {emulator.busy_time:.1f}s")
+        emulator.stop()
+
+if __name__ == "__main__":
+    main()
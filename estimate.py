@@ -0,0 +1,125 @@
+import argparse
+
+from jobs import job_layers
+from machine import MachineProfile
+from toolpath import find_runs, plan_runs, plan_toolpath, row_major, serpentine
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, moves are then timed one by one
+    np = None
+
+# Function to estimate the seconds needed to shoot every cell of `order`, starting from `start`.
+# Cells are (x, y) grid positions sent as `G0 X{x} Y{y} Z{y}`, `cell_size` machine units apart.
+def estimate_toolpath_time(order, profile=None, start=(0, 0), cell_size=1.0):
+    profile = profile or MachineProfile()
+    if not order:
+        return 0.0
+    moves = _steps([start] + list(order), cell_size)
+    return _total_move_time(moves, profile) + len(order) * profile.shot_dwell
+
+# Function to estimate a layer shot as runs, (x, y, end_x) as returned by toolpath.plan_runs.
+# Each run with end_x != x is one burst traverse, slowed down so the gun can shoot every cell.
+def estimate_runs_time(runs, profile=None, start=(0, 0), cell_size=1.0):
+    profile = profile or MachineProfile()
+    if not runs:
+        return 0.0
+    entries = [start]
+    for x, y, end_x in runs[:-1]:
+        entries.extend([(x, y), (end_x, y)])
+    entries.append(runs[-1][:2])
+    travel = _total_move_time(_steps(entries, cell_size)[::2], profile)
+    bursts = [(end_x - x, 0) for x, y, end_x in runs if end_x != x]
+    burst_feed = cell_size / profile.shot_dwell * 60
+    burst_time = _total_move_time(_steps([(0, 0)] + bursts, cell_size, cumulative=False), profile, burst_feed)
+    return travel + burst_time + len(runs) * profile.shot_dwell
+
+# Per-move (dx, dy) in machine units between consecutive points, or the points themselves as deltas
+def _steps(points, cell_size, cumulative=True):
+    if np is None:
+        points = [(x * cell_size, y * cell_size) for x, y in points]
+        if not cumulative:
+            return points[1:]
+        return [(b[0] - a[0], b[1] - a[1]) for a, b in zip(points, points[1:])]
+    points = np.asarray(points, dtype=float).reshape(-1, 2) * cell_size
+    return np.diff(points, axis=0) if cumulative else points[1:]
+
+# Function to add up the time of every (dx, dy) move, with the same trapezoid model as MachineProfile
+def _total_move_time(steps, profile, feed=None):
+    if np is None:
+        return sum(profile.move_time((dx, dy, dy), feed) for dx, dy in steps)
+    if not len(steps):
+        return 0.0
+    delta = np.abs(np.column_stack([steps[:, 0], steps[:, 1], steps[:, 1]]))  # Z follows Y
+    distance = np.sqrt((delta * delta).sum(axis=1))
+    moving = distance > 0
+    delta, distance = delta[moving], distance[moving]
+
+    # Per-axis limits projected onto each move's path, the tightest axis wins
+    with np.errstate(divide='ignore'):
+        ratio = distance[:, None] / delta
+    speed = (np.asarray(profile.max_feed) / 60 * ratio).min(axis=1)
+    if feed:
+        speed = np.minimum(speed, feed / 60)
+    accel = (np.asarray(profile.acceleration) * ratio).min(axis=1)
+    cruising = distance >= speed * speed / accel
+    times = np.where(cruising, distance / speed + speed / accel, 2 * np.sqrt(distance / accel))
+    return float(times.sum())
+
+# Function to compare the projected duration of the toolpath strategies on one layer
+def compare_strategies(cells, profile=None, start=(0, 0), cell_size=1.0):
+    plan = plan_toolpath(cells, start)
+    orders = {'row major': row_major(cells), 'serpentine': serpentine(cells), plan.strategy: plan.order}
+    estimates = {name: estimate_toolpath_time(order, profile, start, cell_size) for name, order in orders.items()}
+    estimates['bursts'] = estimate_runs_time(plan_runs(find_runs(cells), start), profile, start, cell_size)
+    return estimates
+
+# Function to estimate every layer of a job planned by jobs.plan_job, returns [(sheet name, seconds)]
+def estimate_job_time(steps, profile=None, start=(0, 0), cell_size=1.0):
+    estimates = []
+    position = start
+    for step in steps:
+        estimates.append((step.sheet_name, estimate_toolpath_time(step.plan.order, profile, position, cell_size)))
+        position = step.plan.order[-1]
+    return estimates
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+# Function to estimate a whole workbook in the order jobs.plan_job paints it, returns [(sheet name, seconds)].
+# Each layer is timed on its serpentine sweep instead of being planned: planning runs 2-opt on every layer,
+# and the planned toolpath never travels further than the sweep, so this is a quick estimate that
+# errs on the long side. estimate_job_time gives the time of the planned path itself.
+def estimate_workbook(path, profile=None, sheet_names=None, start=(0, 0), max_row=None, max_col=None,
+                      cell_size=1.0):
+    estimates = []
+    position = start
+    for sheet_name, cells in job_layers(path, sheet_names, max_row, max_col):
+        order = serpentine(cells)
+        estimates.append((sheet_name, estimate_toolpath_time(order, profile, position, cell_size)))
+        position = order[-1]
+    return estimates
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate how long each layer of a workbook takes to shoot.")
+    parser.add_argument('workbook', help="Layer workbook (.xlsx)")
+    parser.add_argument('--cell-size', type=float, default=1.0, help="Distance between grid cells in machine units")
+    parser.add_argument('--compare', action='store_true',
+                        help="Also time every toolpath strategy on each layer (plans each layer, slower)")
+    args = parser.parse_args()
+
+    profile = MachineProfile()
+    estimates = estimate_workbook(args.workbook, profile, cell_size=args.cell_size)
+    for sheet_name, seconds in estimates:
+        print(f"{sheet_name}: {format_duration(seconds)}")
+    print(f"Total: {format_duration(sum(seconds for _, seconds in estimates))} for {len(estimates)} layers "
+          f"swept row by row, planned toolpaths take less")
+    if args.compare:
+        for sheet_name, cells in job_layers(args.workbook):
+            strategies = compare_strategies(cells, profile, cell_size=args.cell_size)
+            print(f"{sheet_name}: " + ", ".join(f"{name} {format_duration(seconds)}" for name, seconds in strategies.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import argparse
+import os
+import re
+
+from jobs import plan_job
+from toolpath import find_runs, plan_runs
+
+SHOOT_COMMAND = "M300 S30"  # Use a command suitable for your setup; here's a placeholder
+BURST_COMMAND = "M301"  # Shoots here, then every P units while moving to X
+DECIMALS = 3  # Coordinates are rounded to the controller's resolution
+
+class GcodeProgram:
+    """A compiled layer: the G-code lines to stream and the bytes they save on the wire."""
+
+    def __init__(self, lines, baseline_bytes, end=None):
+        self.lines = lines
+        self.baseline_bytes = baseline_bytes  # Bytes of the same shots sent as one G90/G0 block each
+        self.end = end  # Cell the machine stops on after the last shot
+
+    @property
+    def size(self):
+        # Every line is sent with its newline
+        return sum(len(line) + 1 for line in self.lines)
+
+    @property
+    def saved(self):
+        return self.baseline_bytes - self.size
+
+    def text(self):
+        return '\n'.join(self.lines) + '\n'
+
+    def report(self):
+        ratio = self.saved / self.baseline_bytes if self.baseline_bytes else 0.0
+        return f"{len(self.lines)} lines, {self.size} bytes on the wire, {self.saved} bytes ({ratio:.0%}) saved"
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(self.text())
+
+# Function to format a coordinate with as few characters as the controller accepts: 10, 2.5, .25, -.5
+def format_number(value, decimals=DECIMALS):
+    text = f"{round(value, decimals):.{decimals}f}".rstrip('0').rstrip('.')
+    if text in ('', '-0'):
+        return '0'
+    if text.startswith('0.'):
+        return text[1:]
+    if text.startswith('-0.'):
+        return '-' + text[2:]
+    return text
+
+# Function to build the G-code of one shot at (col, row) with all three axes given.
+# It carries no modal words, so the stream must be in G90/G0 already; a shot sent again
+# after a rejection still lands on its own cell.
+def shot_block(col, row, shot_command=SHOOT_COMMAND, cell_size=1.0):
+    x, y = format_number(col * cell_size), format_number(row * cell_size)
+    return f"X{x} Y{y} Z{y}\n{shot_command}"
+
+# Function to build the G-code of a coverage shot centred on (x, y), spreading over size x size cells.
+# The spread is passed to the shot command as P, in machine units, which only firmware reading it supports.
+def spread_shot_block(x, y, size, shot_command=SHOOT_COMMAND, cell_size=1.0):
+    if size == 1:
+        return shot_block(x, y, shot_command, cell_size)
+    return shot_block(x, y, f"{shot_command} P{format_number(size * cell_size)}", cell_size)
+
+# Function to build the G-code of a run from (col, row) to (end_col, row): one traverse with a shot
+# on every cell. Like shot_block it uses absolute coordinates only, so it can be sent again as is.
+def burst_block(col, row, end_col, shot_command=SHOOT_COMMAND, cell_size=1.0):
+    if end_col == col:
+        return shot_block(col, row, shot_command, cell_size)
+    x, y = format_number(col * cell_size), format_number(row * cell_size)
+    return f"X{x} Y{y} Z{y}\n{BURST_COMMAND} X{format_number(end_col * cell_size)} P{format_number(cell_size)}"
+
+# Bytes the shots of `order` take when every shot re-sends "G90" and a full G0 move
+def baseline_bytes(order, shot_command=SHOOT_COMMAND, cell_size=1.0):
+    return sum(len(f"G90\nG0 X{col * cell_size:g} Y{row * cell_size:g} Z{row * cell_size:g}\n{shot_command}\n")
+               for col, row in order)
+
+# Function to compile an ordered layer into one G-code program.
+# Modal words (G90/G91, G0) are only written when they change and unchanged axes are left out.
+# With `relative`, each move is written in whichever distance mode gives the shorter line.
+# With `bursts`, horizontal runs of adjacent cells are shot in one traverse each (see burst_block),
+# ordered by toolpath.plan_runs instead of following `order`.
+def compile_layer(order, start=(0, 0), shot_command=SHOOT_COMMAND, relative=False, cell_size=1.0, bursts=False):
+    segments = plan_runs(find_runs(order), start) if bursts else [(x, y, x) for x, y in order]
+    lines = []
+    distance_mode = None  # Unknown until the first move sets it
+    motion_mode = None
+    position = (round(start[0] * cell_size, DECIMALS), round(start[1] * cell_size, DECIMALS))
+    for col, row, end_col in segments:
+        target = (round(col * cell_size, DECIMALS), round(row * cell_size, DECIMALS))
+        dx, dy = target[0] - position[0], target[1] - position[1]
+        if distance_mode is None:
+            # The starting position is only assumed, so the first move names every axis
+            absolute_words = axis_words(target[0], target[1], True, True)
+        else:
+            absolute_words = axis_words(target[0], target[1], bool(dx), bool(dy))
+        candidates = [('G90', absolute_words)]
+        if relative and distance_mode is not None:
+            candidates.append(('G91', axis_words(dx, dy, bool(dx), bool(dy))))
+
+        def cost(candidate):
+            mode, words = candidate
+            modal = (len(mode) + 1 if mode != distance_mode else 0)
+            return modal + len(words)
+        mode, words = min(candidates, key=cost)  # Ties keep absolute moves
+
+        if words:
+            modal = []
+            if mode != distance_mode:
+                modal.append(mode)
+                distance_mode = mode
+            if motion_mode != 'G0':
+                modal.append('G0')
+                motion_mode = 'G0'
+            lines.append(' '.join(modal + [words]))
+        position = target
+        if end_col == col:
+            lines.append(shot_command)
+            continue
+        end_x = round(end_col * cell_size, DECIMALS)
+        burst_x = end_x if distance_mode == 'G90' else end_x - position[0]
+        lines.append(f"{BURST_COMMAND} X{format_number(burst_x)} P{format_number(cell_size)}")
+        position = (end_x, position[1])
+    end = (segments[-1][2], segments[-1][1]) if segments else start
+    return GcodeProgram(lines, baseline_bytes(order, shot_command, cell_size), end)
+
+# Axis words of a move; Y and Z drive the same coupled axis so they always move together
+def axis_words(x, y, move_x, move_y):
+    words = []
+    if move_x:
+        words.append(f"X{format_number(x)}")
+    if move_y:
+        y = format_number(y)
+        words.append(f"Y{y} Z{y}")
+    return ' '.join(words)
+
+# Function to compile every color layer of a workbook and write one .gcode file per layer
+# into `directory`, returns [(sheet name, path, program)]
+def compile_workbook(path, directory, shot_command=SHOOT_COMMAND, relative=False, bursts=False,
+                     max_row=None, max_col=None):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    steps = plan_job(path, max_row=max_row, max_col=max_col)
+    return write_programs(steps, stem, directory, shot_command, relative, bursts)
+
+# Function to compile planned job steps (jobs.LayerStep) into {stem}_{sheet}.gcode files in `directory`
+def write_programs(steps, stem, directory, shot_command=SHOOT_COMMAND, relative=False, bursts=False):
+    os.makedirs(directory, exist_ok=True)
+    compiled = []
+    position = (0, 0)
+    for step in steps:
+        program = compile_layer(step.plan.order, position, shot_command, relative, bursts=bursts)
+        file_name = f"{stem}_{re.sub(r'[^0-9A-Za-z_-]+', '_', step.sheet_name)}.gcode"
+        program_path = os.path.join(directory, file_name)
+        program.write(program_path)
+        compiled.append((step.sheet_name, program_path, program))
+        position = program.end
+    return compiled
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile every color layer of a workbook into G-code programs.")
+    parser.add_argument('workbook', help="Layer workbook (.xlsx)")
+    parser.add_argument('--output', default='.', help="Directory the .gcode files are written to")
+    parser.add_argument('--bursts', action='store_true', help="Shoot horizontal runs as M301 bursts")
+    parser.add_argument('--relative', action='store_true', help="Allow relative moves where they are shorter")
+    args = parser.parse_args()
+
+    for sheet_name, path, program in compile_workbook(args.workbook, args.output, relative=args.relative,
+                                                      bursts=args.bursts):
+        print(f"{path}: {program.report()}")
+
+if __name__ == "__main__":
+    main()
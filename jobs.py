@@ -0,0 +1,46 @@
+from toolpath import plan_toolpath
+from workbook import COMPLETE_SHEET_TITLE, read_layers, read_sheet_names
+
+class LayerStep:
+    """One color layer of a job: the operator loads `sheet_name`'s paint, then `plan` is shot."""
+
+    def __init__(self, sheet_name, plan):
+        self.sheet_name = sheet_name
+        self.plan = plan
+
+# Function to order layers for painting, lighter colors first so darker paint covers them.
+# Sheets whose title is not a hex color keep their workbook position after the colored ones.
+def paint_order(sheet_names):
+    def lightness(name):
+        try:
+            r, g, b = (int(name[i:i + 2], 16) for i in (0, 2, 4))
+        except ValueError:
+            return -1
+        return 0.299 * r + 0.587 * g + 0.114 * b
+    return sorted(sheet_names, key=lightness, reverse=True)
+
+# Function to plan every color layer of a workbook as one job.
+# The workbook is read once, and each layer's toolpath starts where the previous layer ended.
+def plan_job(path, sheet_names=None, start=(0, 0), max_row=None, max_col=None):
+    layers = job_layers(path, sheet_names, max_row, max_col)
+    return plan_layers(dict(layers), [name for name, _ in layers], start)
+
+# Function to read the color layers of a workbook in painting order, returns [(sheet name, cells)]
+# for every layer with something to shoot. `sheet_names` defaults to every color sheet in paint_order.
+def job_layers(path, sheet_names=None, max_row=None, max_col=None):
+    if sheet_names is None:
+        sheet_names = paint_order([name for name in read_sheet_names(path) if name != COMPLETE_SHEET_TITLE])
+    layers = read_layers(path, sheet_names, max_row, max_col)
+    return [(name, layers[name]) for name in sheet_names if layers[name]]
+
+# Function to plan {sheet name: cells} layers in the order of `sheet_names`, skipping empty layers
+def plan_layers(layers, sheet_names, start=(0, 0)):
+    steps = []
+    position = start
+    for name in sheet_names:
+        if not layers[name]:  # Nothing to shoot, so no paint change either
+            continue
+        plan = plan_toolpath(layers[name], start=position)
+        steps.append(LayerStep(name, plan))
+        position = plan.order[-1]
+    return steps
@@ -0,0 +1,38 @@
+import math
+
+AXES = 'XYZ'
+
+class MachineProfile:
+    """Kinematic limits of the gantry, shared by the controller emulator and the job-time estimator.
+
+    Y and Z are the two motors of the same coupled axis (every vertical move is
+    sent as `G0 Y.. Z..`), so a move is as slow as its most constrained axis.
+    """
+
+    def __init__(self, max_feed=(3000.0, 3000.0, 3000.0), acceleration=(200.0, 200.0, 200.0), shot_dwell=0.3):
+        self.max_feed = tuple(max_feed)  # Units per minute for X, Y and Z
+        self.acceleration = tuple(acceleration)  # Units per second squared for X, Y and Z
+        self.shot_dwell = shot_dwell  # Seconds the gun needs for one shot
+
+    def move_time(self, delta, feed=None):
+        """Seconds for a straight move by `delta` (dx, dy, dz), starting and ending at rest."""
+        distance = math.sqrt(sum(d * d for d in delta))
+        if not distance:
+            return 0.0
+        # Scale every axis limit onto the path so that no axis exceeds its own
+        speed = min(self.max_feed[i] / 60 * distance / abs(d) for i, d in enumerate(delta) if d)
+        if feed:
+            speed = min(speed, feed / 60)
+        accel = min(self.acceleration[i] * distance / abs(d) for i, d in enumerate(delta) if d)
+        return trapezoid_time(distance, speed, accel)
+
+    def burst_time(self, delta, pitch):
+        """Seconds for a burst: a shot at rest, then shots every `pitch` units while moving by `delta`."""
+        # The traverse is slowed down so the gun can recover between two shots
+        return self.shot_dwell + self.move_time(delta, feed=pitch / self.shot_dwell * 60)
+
+# Time to cover `distance` from rest to rest with a trapezoidal (or triangular) velocity profile
+def trapezoid_time(distance, speed, accel):
+    if distance >= speed * speed / accel:
+        return distance / speed + speed / accel
+    return 2 * math.sqrt(distance / accel)
@@ -0,0 +1,381 @@
+import re
+
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, the per-pixel path is used without it
+    np = None
+
+# Number of pixels compared against the palette at once, bounds the size of the distance matrix
+CHUNK_PIXELS = 65536
+
+DITHER_MODES = (None, 'floyd-steinberg', 'bayer')
+
+# Floyd-Steinberg error weights: (dx, dy, share of the quantization error)
+FLOYD_STEINBERG = ((1, 0, 7 / 16), (-1, 1, 3 / 16), (0, 1, 5 / 16), (1, 1, 1 / 16))
+
+# 4x4 ordered dithering thresholds, normalized to [0, 1)
+BAYER_MATRIX = [[value / 16 for value in row] for row in ((0, 8, 2, 10), (12, 4, 14, 6), (3, 11, 1, 9), (15, 7, 13, 5))]
+
+PALETTE_METHODS = ('kmeans', 'median-cut')
+
+# Pixels kept from the source image when extracting a palette, the colors barely change beyond this
+SAMPLE_PIXELS = 65536
+KMEANS_ITERATIONS = 20
+
+class IndexedImage:
+    """Palette-mapped image stored as one uint8 palette index per pixel."""
+
+    def __init__(self, indices, palette):
+        # indices[y][x] is the palette index of a pixel: a 2D uint8 array with NumPy, rows of bytearrays without
+        self.indices = indices
+        self.palette = [tuple(color) for color in palette]
+
+    @property
+    def size(self):
+        return (len(self.indices[0]) if len(self.indices) else 0, len(self.indices))
+
+    def mask(self, index):
+        """Boolean layer mask of the pixels mapped to palette entry `index`."""
+        if np is not None:
+            return self.indices == index
+        return [[value == index for value in row] for row in self.indices]
+
+    def rows(self):
+        """Iterate over the index map one row at a time as lists of ints."""
+        for row in self.indices:
+            yield row.tolist() if np is not None else list(row)
+
+    def layer_cells(self):
+        """Bucket pixel coordinates by palette index in a single pass.
+
+        Returns one list of (x, y) cells per palette entry, in row-major order,
+        so each layer only carries the cells it actually fills.
+        """
+        width = self.size[0]
+        if np is not None:
+            flat = self.indices.reshape(-1)
+            order = np.argsort(flat, kind='stable')
+            bounds = np.cumsum(np.bincount(flat, minlength=len(self.palette)))[:-1]
+            layers = []
+            for positions in np.split(order, bounds):
+                ys, xs = np.divmod(positions, width)
+                layers.append(list(zip(xs.tolist(), ys.tolist())))
+            return layers
+        layers = [[] for _ in self.palette]
+        for y, row in enumerate(self.indices):
+            for x, value in enumerate(row):
+                layers[value].append((x, y))
+        return layers
+
+    def to_image(self):
+        if np is not None:
+            colors = np.asarray(self.palette, dtype=np.uint8).reshape(-1, 3)
+            return Image.fromarray(colors[self.indices], 'RGB')
+        img = Image.new('RGB', self.size)
+        img.putdata([self.palette[value] for row in self.indices for value in row])
+        return img
+
+# Function to find the nearest palette index for every pixel of an image in one batched operation
+def nearest_palette_indices(img, palette, chunk_pixels=CHUNK_PIXELS):
+    img = img.convert('RGB')
+    pixels = np.asarray(img, dtype=np.int32).reshape(-1, 3)
+    colors = np.asarray(palette, dtype=np.int32).reshape(-1, 3)
+    return _nearest_indices(pixels, colors, chunk_pixels).reshape(img.size[1], img.size[0])
+
+def _nearest_indices(pixels, colors, chunk_pixels=CHUNK_PIXELS):
+    indices = np.empty(len(pixels), dtype=np.uint8)
+    for start in range(0, len(pixels), chunk_pixels):
+        chunk = pixels[start:start + chunk_pixels]
+        diff = chunk[:, None, :] - colors[None, :, :]
+        # argmin keeps the first of equally distant colors, the same tie-break as min()
+        indices[start:start + chunk_pixels] = (diff * diff).sum(axis=2).argmin(axis=1)
+    return indices
+
+# Function to map an image onto a palette as an index map.
+# `dither` is None for plain nearest-color snapping, or one of DITHER_MODES.
+def quantize(img, palette, dither=None):
+    if len(palette) > 256:
+        raise ValueError("A palette can hold at most 256 colors")
+    if dither not in DITHER_MODES:
+        raise ValueError(f"Unknown dithering mode {dither!r}, expected one of {DITHER_MODES}")
+    img = img.convert('RGB')
+    if dither == 'floyd-steinberg':
+        return IndexedImage(floyd_steinberg_indices(img, palette), palette)
+    if dither == 'bayer':
+        return IndexedImage(bayer_indices(img, palette), palette)
+    if np is not None:
+        return IndexedImage(nearest_palette_indices(img, palette), palette)
+
+    # Per-pixel fallback used when NumPy is not installed
+    width, height = img.size
+    pixels = img.load()
+    nearest = {}
+    rows = []
+    for y in range(height):
+        row = bytearray(width)
+        for x in range(width):
+            color = pixels[x, y]
+            if color not in nearest:
+                nearest[color] = _nearest_index(color, palette)
+            row[x] = nearest[color]
+        rows.append(row)
+    return IndexedImage(rows, palette)
+
+# Find the nearest color from the palette
+def _nearest_index(color, palette):
+    return min(range(len(palette)), key=lambda i: sum((s - q) ** 2 for s, q in zip(palette[i], color)))
+
+# Function to dither an image onto a palette with Floyd-Steinberg error diffusion.
+# Pixel (x, y) only receives error from pixels with a smaller x + 2y, so all pixels on one
+# x + 2y = t line are independent: they are quantized and spread their error as one array operation,
+# which gives the exact sequential result in W + 2H vectorized steps.
+def floyd_steinberg_indices(img, palette):
+    if np is None:
+        # Pillow's built-in ditherer, its nearest-color search is approximate
+        palette_image = Image.new('P', (1, 1))
+        padding = list(palette[0]) * (256 - len(palette))
+        palette_image.putpalette([value for color in palette for value in color] + padding)
+        indexed = img.quantize(palette=palette_image, dither=Image.Dither.FLOYDSTEINBERG)
+        width = img.size[0]
+        data = bytes(index if index < len(palette) else 0 for index in indexed.getdata())
+        return [bytearray(data[y * width:(y + 1) * width]) for y in range(img.size[1])]
+
+    pixels = np.asarray(img, dtype=np.float32).copy()  # Accumulates the diffused error
+    colors = np.asarray(palette, dtype=np.float32).reshape(-1, 3)
+    height, width = pixels.shape[:2]
+    indices = np.empty((height, width), dtype=np.uint8)
+    rows = np.arange(height)
+    for t in range(width + 2 * (height - 1)):
+        ys = rows[max(0, (t - width + 2) // 2):min(height - 1, t // 2) + 1]
+        xs = t - 2 * ys
+        values = pixels[ys, xs]
+        diff = values[:, None, :] - colors[None, :, :]
+        nearest = (diff * diff).sum(axis=2).argmin(axis=1)
+        indices[ys, xs] = nearest
+        error = values - colors[nearest]
+        for dx, dy, weight in FLOYD_STEINBERG:
+            tx, ty = xs + dx, ys + dy
+            inside = (tx >= 0) & (tx < width) & (ty < height)
+            pixels[ty[inside], tx[inside]] += error[inside] * weight
+    return indices
+
+# Function to dither an image onto a palette with an ordered Bayer threshold map
+def bayer_indices(img, palette):
+    width, height = img.size
+    size = len(BAYER_MATRIX)
+    spread = _palette_spacing(palette)
+    if np is None:
+        pixels = img.load()
+        rows = []
+        for y in range(height):
+            row = bytearray(width)
+            for x in range(width):
+                offset = (BAYER_MATRIX[y % size][x % size] - 0.5) * spread
+                row[x] = _nearest_index([value + offset for value in pixels[x, y]], palette)
+            rows.append(row)
+        return rows
+
+    threshold = np.asarray(BAYER_MATRIX, dtype=np.float32)
+    offsets = (np.tile(threshold, (height // size + 1, width // size + 1))[:height, :width] - 0.5) * spread
+    pixels = np.asarray(img, dtype=np.float32) + offsets[:, :, None]
+    colors = np.asarray(palette, dtype=np.float32).reshape(-1, 3)
+    return _nearest_indices(pixels.reshape(-1, 3), colors).reshape(height, width)
+
+# Average distance from each palette color to its closest neighbour, scales the Bayer offsets
+def _palette_spacing(palette):
+    if len(palette) < 2:
+        return 0.0
+    distances = []
+    for i, color in enumerate(palette):
+        distances.append(min(sum((a - b) ** 2 for a, b in zip(color, other)) ** 0.5
+                             for j, other in enumerate(palette) if j != i))
+    return sum(distances) / len(distances)
+
+# Function to read a palette file: one paint color per line as RRGGBB or #RRGGBB, optionally
+# followed by a name ("#FF0000 fire red"); blank lines and lines starting with ';' are skipped
+def read_palette(path):
+    palette = []
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith(';'):
+                continue
+            match = re.match(r'#?([0-9A-Fa-f]{6})\b', line)
+            if not match:
+                raise ValueError(f"{path}:{number}: expected a color such as #FF0000, got {line!r}")
+            palette.append(tuple(int(match.group(1)[i:i + 2], 16) for i in (0, 2, 4)))
+    if not palette:
+        raise ValueError(f"{path}: no colors found")
+    return palette
+
+# Function to pick `count` representative colors from an image, most common first.
+# The image is subsampled to about `sample_pixels` first, so the cost does not grow with the photo.
+# With an `inventory` of paint colors, the result is snapped to the closest available paints.
+def extract_palette(img, count, method='kmeans', inventory=None, sample_pixels=SAMPLE_PIXELS):
+    if not 1 <= count <= 256:
+        raise ValueError("A palette holds between 1 and 256 colors")
+    if method not in PALETTE_METHODS:
+        raise ValueError(f"Unknown palette method {method!r}, expected one of {PALETTE_METHODS}")
+    sample = _sample_image(img, sample_pixels)
+    if method == 'kmeans' and np is not None:
+        palette = _kmeans_palette(np.asarray(sample, dtype=np.float64).reshape(-1, 3), count)
+    else:
+        # Pillow's median cut runs in C and also stands in for k-means without NumPy
+        quantized = sample.quantize(count, method=Image.Quantize.MEDIANCUT)
+        colors = quantized.getpalette()
+        used = sorted(((n, index) for n, index in quantized.getcolors(256)), reverse=True)
+        palette = [tuple(colors[index * 3:index * 3 + 3]) for n, index in used]
+    if inventory:
+        palette = snap_to_inventory(palette, inventory)
+    return palette
+
+# Function to open an image file and extract its palette, decoding JPEGs at a reduced scale
+def image_palette(path, count, method='kmeans', inventory=None, sample_pixels=SAMPLE_PIXELS):
+    with Image.open(path) as img:
+        return extract_palette(img, count, method, inventory, sample_pixels)
+
+def _sample_image(img, sample_pixels):
+    width, height = img.size
+    factor = max(1, int((width * height / sample_pixels) ** 0.5))
+    if factor > 1:
+        # JPEG decodes straight at 1/2, 1/4 or 1/8 scale; a no-op for other formats or loaded images
+        img.draft('RGB', (width // factor, height // factor))
+        factor = max(1, int((img.size[0] * img.size[1] / sample_pixels) ** 0.5))
+    if img.mode not in ('RGB', 'RGBA', 'L', 'LA', 'RGBX'):
+        img = img.convert('RGB')
+    if factor > 1:
+        img = img.reduce(factor)  # Box filter in C, averages each factor x factor block
+    return img.convert('RGB')
+
+def _kmeans_palette(pixels, count):
+    # Pixels are grouped into 32 levels per channel first; each group enters k-means once, at its
+    # mean color and weighted by its size, which leaves a few thousand points for a typical photo
+    keys = ((pixels.astype(np.int32) >> 3) * np.array([1024, 32, 1], dtype=np.int32)).sum(axis=1)
+    keys, inverse, weights = np.unique(keys, return_inverse=True, return_counts=True)
+    points = np.stack([np.bincount(inverse.reshape(-1), weights=pixels[:, channel]) for channel in range(3)], axis=1)
+    points /= weights[:, None]
+
+    rng = np.random.default_rng(0)  # Seeded, so the same image always gives the same palette
+    # k-means++ seeding: each new center is drawn far from the ones already chosen
+    centers = [points[rng.choice(len(points), p=weights / weights.sum())]]
+    nearest = ((points - centers[0]) ** 2).sum(axis=1) * weights
+    for _ in range(1, count):
+        if not nearest.any():
+            break  # Fewer distinct colors than requested
+        centers.append(points[rng.choice(len(points), p=nearest / nearest.sum())])
+        nearest = np.minimum(nearest, ((points - centers[-1]) ** 2).sum(axis=1) * weights)
+    centers = np.asarray(centers)
+    count = len(centers)
+
+    squared = (points * points).sum(axis=1)[:, None]
+    for _ in range(KMEANS_ITERATIONS):
+        # |p - c|^2 = |p|^2 - 2 p.c + |c|^2, one matrix product instead of a points x colors x 3 array
+        distances = squared - 2 * points @ centers.T + (centers * centers).sum(axis=1)[None, :]
+        labels = distances.argmin(axis=1)
+        sizes = np.bincount(labels, weights=weights, minlength=count)
+        sums = np.stack([np.bincount(labels, weights=weights * points[:, channel], minlength=count)
+                         for channel in range(3)], axis=1)
+        updated = np.where(sizes[:, None] > 0, sums / np.maximum(sizes, 1)[:, None], centers)
+        converged = np.abs(updated - centers).max() < 0.5
+        centers = updated
+        if converged:
+            break
+    order = np.argsort(-sizes, kind='stable')
+    return [tuple(int(value) for value in np.clip(np.rint(center), 0, 255)) for center in centers[order]]
+
+# Function to replace each extracted color with the closest paint in the inventory. The closest
+# color-paint pairs are matched first so two colors only share a paint when the inventory runs out;
+# the result keeps the order of `palette` without duplicates.
+def snap_to_inventory(palette, inventory):
+    pairs = sorted((sum((a - b) ** 2 for a, b in zip(color, paint)), i, j)
+                   for i, color in enumerate(palette) for j, paint in enumerate(inventory))
+    chosen = {}
+    used = set()
+    for distance, i, j in pairs:
+        if i not in chosen and j not in used:
+            chosen[i] = j
+            used.add(j)
+    snapped = []
+    for i, color in enumerate(palette):
+        paint = tuple(inventory[chosen[i]] if i in chosen else inventory[_nearest_index(color, inventory)])
+        if paint not in snapped:
+            snapped.append(paint)
+    return snapped
+
+# Function to load an image file at the target grid size and map it onto the palette,
+# the same steps as the convertor's Generate Pixel Art button
+def pixel_art(path, palette, size, dither=None):
+    return quantize(load_image(path, size), palette, dither)
+
+# Function to load an image file as RGB at exactly `size`, decoding no more of it than needed.
+# JPEG and JPEG 2000 decoders scale down while decoding, to the smallest scale still covering `size`;
+# other formats are sampled to `size` in their own mode, so only the small result is converted.
+def load_image(path, size):
+    width, height = size
+    with Image.open(path) as img:
+        img.draft('RGB', (width, height))  # JPEG: DCT scaling by 1/2, 1/4 or 1/8, a no-op for other formats
+        if img.format == 'JPEG2000':
+            try:
+                levels, available = 0, _jpeg2000_levels(img)
+                while (levels < available and img.size[0] >> (levels + 1) >= width
+                       and img.size[1] >> (levels + 1) >= height):
+                    levels += 1
+                img.reduce = levels  # Skips the finest resolution levels of the codestream
+            except (AttributeError, IndexError, OSError, TypeError, ValueError):
+                pass  # Unexpected codestream or decoder internals, the image is decoded at full size
+        img = img.resize(size, Image.Resampling.NEAREST)
+    return img.convert('RGB')
+
+# Number of resolution levels a JPEG 2000 file can be reduced by, read from the COD marker of its
+# codestream header. Raises ValueError when the file does not look like one.
+def _jpeg2000_levels(img):
+    position = img.fp.tell()
+    try:
+        img.fp.seek(img.tile[0][2])
+        header = _jpeg2000_codestream_header(img.fp)
+    finally:
+        img.fp.seek(position)
+    offset = 2
+    while offset + 4 <= len(header):
+        marker, length = header[offset:offset + 2], int.from_bytes(header[offset + 2:offset + 4], 'big')
+        if marker == b'\xff\x52':
+            # Segment length, coding style, progression order, layers and transform come before the level count
+            levels = header[offset + 9]
+            if levels > 32:
+                raise ValueError(f"{levels} resolution levels")
+            return levels
+        if marker[0] != 0xFF or marker == b'\xff\x90' or length < 2:
+            break  # Start of the first tile, or not a marker segment
+        offset += 2 + length
+    raise ValueError("no COD marker in the codestream header")
+
+# Function to read the start of a JPEG 2000 codestream, a raw .j2k stream or the jp2c box of a .jp2 file
+def _jpeg2000_codestream_header(fp, size=4096):
+    start = fp.tell()
+    if fp.read(4) != b'\xff\x4f\xff\x51':  # SOC then SIZ open a raw codestream
+        fp.seek(start)
+        while True:
+            box = fp.read(8)
+            if len(box) < 8:
+                raise ValueError("no JPEG 2000 codestream")
+            length, kind = int.from_bytes(box[:4], 'big'), box[4:]
+            skipped = 8
+            if length == 1:  # A 64-bit box length follows the box type
+                length, skipped = int.from_bytes(fp.read(8), 'big'), 16
+            if kind == b'jp2c':
+                break
+            if length < skipped:
+                raise ValueError("malformed JPEG 2000 box")
+            fp.seek(length - skipped, 1)
+        start = fp.tell()
+    fp.seek(start)
+    header = fp.read(size)
+    if not header.startswith(b'\xff\x4f\xff\x51'):
+        raise ValueError("no JPEG 2000 codestream")
+    return header
+
+# Function to map image colors to a predefined palette
+def map_colors(img, palette, dither=None):
+    return quantize(img, palette, dither).to_image()
@@ -0,0 +1,134 @@
+import os
+from functools import lru_cache
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor, QImage, QPixmap
+from PyQt5.QtWidgets import QFileDialog, QMessageBox
+
+from tasks import load_workbook, run_task
+from workbook import COMPLETE_SHEET_TITLE, cached_layer_cells, read_sheet_names
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, cells are then painted one by one
+    np = None
+
+BACKGROUND = (149, 165, 166)  # The labels' #95a5a6, so white paint stays visible
+UNKNOWN_COLOR = (64, 64, 64)  # For sheets whose title is not a hex color
+DONE_COLOR = (46, 204, 113)  # Cells a running job has finished
+
+# Rendered previews kept per (file, sheet, size), least recently used entries are evicted first
+PIXMAP_CACHE_SIZE = 64
+
+# Function to read the paint color a layer sheet is named after, e.g. "FF0000"
+def sheet_color(sheet_name):
+    try:
+        return tuple(int(sheet_name[i:i + 2], 16) for i in (0, 2, 4))
+    except ValueError:
+        return UNKNOWN_COLOR
+
+# Function to get a layer's preview scaled to fit width x height, rendered once per file version
+def layer_pixmap(path, sheet_name, width, height):
+    path = os.path.abspath(path)
+    return _layer_pixmap(path, os.stat(path).st_mtime_ns, sheet_name, width, height)
+
+@lru_cache(maxsize=PIXMAP_CACHE_SIZE)
+def _layer_pixmap(path, mtime, sheet_name, width, height):
+    image, pixels = layer_image(path, sheet_name)
+    # Fast transformation keeps every cell a sharp square
+    return QPixmap.fromImage(image).scaled(width, height, Qt.KeepAspectRatio, Qt.FastTransformation)
+
+# Function to render a layer at one pixel per cell. Returns the QImage and the buffer it wraps
+# without copying, which must be kept alive as long as the image is used.
+def layer_image(path, sheet_name):
+    sheet_names = read_sheet_names(path)
+    if sheet_name == COMPLETE_SHEET_TITLE:
+        # The complete image has every color, so it is composed from the layers
+        layers = [(sheet_color(name), cached_layer_cells(path, name))
+                  for name in sheet_names if name != COMPLETE_SHEET_TITLE]
+    else:
+        layers = [(sheet_color(sheet_name), cached_layer_cells(path, sheet_name))]
+
+    # Every layer of a workbook is drawn on the grid of the complete image, so they line up
+    extent = cached_layer_cells(path, COMPLETE_SHEET_TITLE) if COMPLETE_SHEET_TITLE in sheet_names else []
+    extent = list(extent) + [cell for _, cells in layers for cell in cells]
+    grid_width = max((x for x, _ in extent), default=0) + 1
+    grid_height = max((y for _, y in extent), default=0) + 1
+
+    pixels = render_layers(layers, grid_width, grid_height)
+    return QImage(pixels, grid_width, grid_height, grid_width * 3, QImage.Format_RGB888), pixels
+
+class LayerBrowser:
+    """Workbook loading and layer previews, shared by the GUI windows.
+
+    Mixed into a QMainWindow that has `layer_combobox` and `layer_preview` widgets
+    and sets `load_task` to None before the first load.
+    """
+
+    def load_excel_file(self):
+        file_name, _ = QFileDialog.getOpenFileName(self, "Open Excel File", "", "Excel Files (*.xlsx)")
+        if file_name:
+            # Parsed on the worker pool, the machine can be jogged while a large workbook loads
+            if self.load_task:
+                self.load_task.cancel()
+            self.load_task = run_task(load_workbook, file_name)
+            self.load_task.signals.partial.connect(lambda sheet_names: self.show_sheet_names(file_name, sheet_names))
+            self.load_task.signals.progress.connect(self.show_load_progress)
+            self.load_task.signals.result.connect(
+                lambda sheet_names: self.statusBar().showMessage(f"Loaded {len(sheet_names)} layers from {file_name}", 5000))
+            self.load_task.signals.error.connect(lambda message: QMessageBox.critical(self, "Load Error", message))
+
+    def show_load_progress(self, done, total, sheet_name):
+        self.statusBar().showMessage(f"Loading layers {done}/{total}: {sheet_name}")
+
+    def show_sheet_names(self, file_name, sheet_names):
+        self.excel_file = file_name
+        self.sheet_names = sheet_names
+        self.layer_combobox.clear()
+        self.layer_combobox.addItems(sheet_names)
+
+    def show_layer_preview(self, sheet_name):
+        if not sheet_name or not getattr(self, 'excel_file', None):
+            return
+        # Rendered from the parsed layer and cached, so switching layers back and forth is instant
+        size = self.layer_preview.size()
+        self.layer_preview.setPixmap(layer_pixmap(self.excel_file, sheet_name, size.width(), size.height()))
+
+class ProgressOverlay:
+    """A layer preview with the cells already done marked, for a running job.
+
+    Each batch only repaints its own cells on the one-pixel-per-cell image and
+    scales it once, so the cost follows the batch rate, not the shot rate.
+    """
+
+    def __init__(self, path, sheet_name):
+        self.sheet_name = sheet_name
+        image, pixels = layer_image(path, sheet_name)
+        self.image = image.copy()  # Owns its pixels, so cells can be marked on it
+        self.done_color = QColor(*DONE_COLOR)
+
+    def add(self, cells):
+        for x, y in cells:
+            if self.image.valid(x, y):
+                self.image.setPixelColor(x, y, self.done_color)
+
+    def pixmap(self, width, height):
+        return QPixmap.fromImage(self.image).scaled(width, height, Qt.KeepAspectRatio, Qt.FastTransformation)
+
+# Function to paint [(color, cells)] layers onto a width x height RGB buffer, returns its bytes
+def render_layers(layers, width, height, background=BACKGROUND):
+    if np is not None:
+        pixels = np.empty((height, width, 3), dtype=np.uint8)
+        pixels[:] = background
+        for color, cells in layers:
+            if cells:
+                cells = np.asarray(cells, dtype=np.intp)
+                pixels[cells[:, 1], cells[:, 0]] = color
+        return pixels.tobytes()
+    pixels = bytearray(bytes(background) * width * height)
+    for color, cells in layers:
+        color = bytes(color)
+        for x, y in cells:
+            offset = (y * width + x) * 3
+            pixels[offset:offset + 3] = color
+    return bytes(pixels)
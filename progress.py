@@ -0,0 +1,75 @@
+import threading
+import time
+
+from estimate import format_duration
+
+# Shortest time between two progress batches, so the UI gets at most 10 updates a second
+PROGRESS_INTERVAL = 0.1
+
+class JobProgress:
+    """One batch of job progress, sent to the UI instead of one signal per move."""
+
+    def __init__(self, sheet_name, done, total, shots, cells, elapsed):
+        self.sheet_name = sheet_name
+        self.done = done  # Positions reached so far
+        self.total = total
+        self.shots = shots  # Shots fired so far
+        self.cells = cells  # Cells completed since the previous batch
+        self.elapsed = elapsed
+
+    @property
+    def throughput(self):
+        return self.done / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def eta(self):
+        return (self.total - self.done) / self.throughput if self.throughput else None
+
+    def report(self):
+        eta = format_duration(self.eta) if self.eta is not None else '--'
+        shots = f", {self.shots} shots" if self.shots else ''
+        return f"{self.sheet_name}: {self.done}/{self.total} positions{shots}, {self.throughput:.1f}/s, ETA {eta}"
+
+class ProgressBatcher:
+    """Collects per-move updates from any thread and hands them to `emit` as JobProgress batches.
+
+    A batch goes out at most every `interval` seconds, plus a final one from flush(),
+    so the number of cross-thread signals does not grow with the machine's speed.
+    """
+
+    def __init__(self, sheet_name, total, emit, interval=PROGRESS_INTERVAL):
+        self.sheet_name = sheet_name
+        self.total = total
+        self.emit = emit
+        self.interval = interval
+        self.done = 0
+        self.shots = 0
+        self._cells = []
+        self._started = time.monotonic()
+        self._last_emit = self._started
+        self._lock = threading.Lock()
+
+    def position_done(self, cell, shots=0):
+        with self._lock:
+            self.done += 1
+            self.shots += shots
+            self._cells.append(cell)
+            if time.monotonic() - self._last_emit < self.interval and self.done < self.total:
+                return
+            batch = self._batch()
+        self.emit(batch)
+
+    def flush(self):
+        """Send whatever was collected since the last batch."""
+        with self._lock:
+            if not self._cells:
+                return
+            batch = self._batch()
+        self.emit(batch)
+
+    def _batch(self):
+        now = time.monotonic()
+        batch = JobProgress(self.sheet_name, self.done, self.total, self.shots, self._cells, now - self._started)
+        self._cells = []
+        self._last_emit = now
+        return batch
@@ -0,0 +1,69 @@
+from toolpath import plan_toolpath
+
+# Widest spread the gun can cover with one shot, in cells (a power of two)
+MAX_SPREAD = 4
+
+class CoveragePlan:
+    """Shots covering one layer: (x, y, size) with x, y the centre of a size x size block of cells."""
+
+    def __init__(self, shots, cell_count):
+        self.shots = shots
+        self.cell_count = cell_count  # Shots fired with one shot per cell
+
+    @property
+    def reduction(self):
+        return 1 - len(self.shots) / self.cell_count if self.cell_count else 0.0
+
+    def report(self):
+        wide = sum(1 for shot in self.shots if shot[2] > 1)
+        return (f"{len(self.shots)} shots ({wide} wide) for {self.cell_count} cells, "
+                f"{self.reduction:.0%} fewer than one shot per cell")
+
+# Function to cover a layer's filled cells with a quadtree: every fully filled block up to
+# `max_spread` cells wide becomes one wide shot, partly filled blocks are split further, so
+# single-cell shots are only left along the edges of the filled areas
+def quadtree_cover(cells, max_spread=MAX_SPREAD):
+    cells = set(cells)
+    if not cells:
+        return []
+    width = max(x for x, _ in cells) + 1
+    height = max(y for _, y in cells) + 1
+
+    # Summed-area table, so counting the filled cells of any block is four lookups
+    table = [[0] * (width + 1) for _ in range(height + 1)]
+    for y in range(height):
+        row_sum = 0
+        for x in range(width):
+            row_sum += (x, y) in cells
+            table[y + 1][x + 1] = table[y][x + 1] + row_sum
+
+    def filled(x, y, size):
+        x1, y1 = min(x + size, width), min(y + size, height)
+        if x >= x1 or y >= y1:
+            return 0
+        return table[y1][x1] - table[y][x1] - table[y1][x] + table[y][x]
+
+    size = 1
+    while size < max(width, height):
+        size *= 2
+    shots = []
+    stack = [(0, 0, size)]
+    while stack:
+        x, y, size = stack.pop()
+        count = filled(x, y, size)
+        if not count:
+            continue
+        if count == size * size and size <= max_spread:
+            offset = (size - 1) / 2 if size > 1 else 0
+            shots.append((x + offset, y + offset, size))
+            continue
+        half = size // 2
+        stack.extend([(x + half, y + half, half), (x, y + half, half), (x + half, y, half), (x, y, half)])
+    return shots
+
+# Function to plan a layer in coverage mode: the quadtree shots ordered to minimize travel
+def plan_coverage(cells, start=(0, 0), max_spread=MAX_SPREAD):
+    shots = quadtree_cover(cells, max_spread)
+    sizes = {shot[:2]: shot[2] for shot in shots}
+    order = plan_toolpath(list(sizes), start).order
+    return CoveragePlan([(x, y, sizes[(x, y)]) for x, y in order], len(set(cells)))
@@ -0,0 +1,92 @@
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+from workbook import cached_layer_cells, read_sheet_names
+
+# Machine work holds its thread for a whole move or layer job, so it runs on a pool of its own
+# and never delays loading and previews, which share the global pool's one thread per core
+MACHINE_THREADS = 4
+
+class TaskSignals(QObject):
+    """Signals of a Task, delivered on the UI thread through queued connections."""
+    progress = pyqtSignal(int, int, str)  # Steps done, total steps, what was just done
+    partial = pyqtSignal(object)  # Part of the result available early, e.g. the sheet names of a loading workbook
+    result = pyqtSignal(object)
+    error = pyqtSignal(str)
+    finished = pyqtSignal()  # Emitted last, whether the task succeeded, failed or was cancelled
+
+class Task(QRunnable):
+    """Runs `function(task, *args)` on the shared worker pool.
+
+    The function reports progress with `task.report` and checks `task.cancelled`
+    between steps; the result of a cancelled task is dropped.
+    """
+
+    def __init__(self, function, *args):
+        super().__init__()
+        self.setAutoDelete(False)  # The UI keeps the task to cancel it
+        self.function = function
+        self.args = args
+        self.signals = TaskSignals()
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def report(self, done, total, message=''):
+        self.signals.progress.emit(done, total, message)
+
+    def publish(self, value):
+        self.signals.partial.emit(value)
+
+    def run(self):
+        try:
+            result = self.function(self, *self.args)
+            if not self.cancelled:
+                self.signals.result.emit(result)
+        except Exception as e:
+            self.signals.error.emit(str(e))
+        finally:
+            self.signals.finished.emit()
+
+# Tasks started and not finished yet; the pool does not own them, so they are kept alive here
+_running = set()
+_machine_pool = None
+
+# Function to start `function(task, *args)` on the shared worker pool, returns the Task
+def run_task(function, *args):
+    return _start(QThreadPool.globalInstance(), function, args)
+
+# Function to start `function(task, *args)` on the machine pool, for work that waits on the machine
+def run_machine_task(function, *args):
+    global _machine_pool
+    if _machine_pool is None:
+        _machine_pool = QThreadPool()
+        _machine_pool.setMaxThreadCount(MACHINE_THREADS)
+    return _start(_machine_pool, function, args)
+
+def _start(pool, function, args):
+    task = Task(function, *args)
+    _running.add(task)
+    task.signals.finished.connect(lambda: _running.discard(task))
+    # Started from the event loop, so the caller has connected its signals before the task can emit
+    QTimer.singleShot(0, lambda: pool.start(task))
+    return task
+
+# Task function: read a workbook's sheet names, then parse every layer into the layer cache
+# so selecting, previewing and running a layer afterwards does not touch the file again.
+# The names are published as soon as they are read, the layers can be listed while they parse.
+def load_workbook(task, path):
+    sheet_names = read_sheet_names(path)
+    task.publish(sheet_names)
+    for i, sheet_name in enumerate(sheet_names):
+        if task.cancelled:
+            break
+        cached_layer_cells(path, sheet_name)
+        task.report(i + 1, len(sheet_names), sheet_name)
+    return sheet_names
@@ -0,0 +1,48 @@
+import time
+import unittest
+
+import serial
+
+from benchmark import random_layer, run_job
+from emulator import WELCOME, ControllerEmulator
+from machine import MachineProfile
+from transport import SOFT_RESET
+
+class ResetTest(unittest.TestCase):
+    """A soft reset drops everything the emulator was doing, like the real firmware."""
+
+    def setUp(self):
+        self.emulator = ControllerEmulator(MachineProfile((600.0,) * 3, (100.0,) * 3))
+        self.ser = serial.Serial(self.emulator.start(), 115200, timeout=1.5)
+
+    def tearDown(self):
+        self.ser.close()
+        self.emulator.stop()
+
+    def test_reset_drops_line_being_executed(self):
+        # The dwell is being executed, waiting for the move, when the reset arrives
+        self.ser.write(b"G0 X10\nG4 P0\n")  # About a second of motion
+        self.assertEqual(self.ser.readline().strip(), b'ok')
+        time.sleep(0.2)
+        self.ser.write(SOFT_RESET)
+        replies = [line.strip().decode() for line in self.ser.readlines()]
+        self.assertEqual(replies[0], 'ALARM:3')
+        self.assertIn(WELCOME, replies)
+        self.assertNotIn('ok', replies)
+        # The machine stopped part way, nothing is left to run
+        self.assertLess(self.emulator.position[0], 10)
+        self.assertFalse(self.emulator.planner)
+
+class JobTest(unittest.TestCase):
+    """A layer shot through the transport, timed by the emulator."""
+
+    def test_machine_time_matches_estimate(self):
+        cells = random_layer(40, 20, 20)
+        result = run_job(cells, time_scale=0.002)
+        self.assertTrue(result['completed'])
+        self.assertEqual(sorted((round(x), round(y)) for x, y, _ in result['shots']), sorted(cells))
+        self.assertEqual(result['overflows'], 0)
+        self.assertAlmostEqual(result['machine'], result['estimate'], delta=0.01 * result['estimate'])
+
+if __name__ == "__main__":
+    unittest.main()
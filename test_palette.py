@@ -0,0 +1,70 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+import palette
+from palette import FLOYD_STEINBERG, _nearest_index, quantize
+
+PALETTE = [(0, 0, 0), (255, 255, 255), (200, 30, 30), (30, 60, 200), (240, 200, 40), (128, 128, 128)]
+
+# Function to make a width x height RGB image of random colors, the same one for the same seed
+def random_image(width, height, seed=0):
+    pixels = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return Image.fromarray(pixels, 'RGB')
+
+# Function to read an index map as rows of ints, whichever form quantize returned it in
+def index_rows(img_indexed):
+    return [list(row) for row in img_indexed.rows()]
+
+# Sequential Floyd-Steinberg in float32, one pixel at a time in row-major order
+def sequential_floyd_steinberg(img, colors):
+    pixels = np.asarray(img, dtype=np.float32).copy()
+    colors = np.asarray(colors, dtype=np.float32)
+    height, width = pixels.shape[:2]
+    indices = [[0] * width for _ in range(height)]
+    for y in range(height):
+        for x in range(width):
+            value = pixels[y, x]
+            nearest = int(((value - colors) ** 2).sum(axis=1).argmin())
+            indices[y][x] = nearest
+            error = value - colors[nearest]
+            for dx, dy, weight in FLOYD_STEINBERG:
+                if 0 <= x + dx < width and y + dy < height:
+                    pixels[y + dy, x + dx] += error * weight
+    return indices
+
+class QuantizeTest(unittest.TestCase):
+    """The batched quantizer against the per-pixel nearest-color search it replaced."""
+
+    def test_matches_per_pixel_search(self):
+        img = random_image(61, 37)
+        expected = [[_nearest_index(img.getpixel((x, y)), PALETTE) for x in range(img.width)] for y in range(img.height)]
+        self.assertEqual(index_rows(quantize(img, PALETTE)), expected)
+
+    def test_matches_fallback_without_numpy(self):
+        # Equally distant colors too, both paths keep the first one
+        img = random_image(40, 25, seed=1)
+        ties = [(100, 100, 100), (50, 100, 100), (150, 100, 100)]
+        for colors in (PALETTE, ties):
+            vectorized = index_rows(quantize(img, colors))
+            with mock.patch.object(palette, 'np', None):
+                self.assertEqual(index_rows(quantize(img, colors)), vectorized)
+
+    def test_chunks_do_not_change_the_result(self):
+        img = random_image(50, 30, seed=2)
+        whole = palette.nearest_palette_indices(img, PALETTE)
+        np.testing.assert_array_equal(palette.nearest_palette_indices(img, PALETTE, chunk_pixels=7), whole)
+
+class FloydSteinbergTest(unittest.TestCase):
+    """The diagonal-wavefront Floyd-Steinberg against the plain sequential loop."""
+
+    def test_matches_sequential_dithering(self):
+        for width, height, seed in ((48, 32, 0), (1, 9, 1), (9, 1, 2), (17, 23, 3)):
+            img = random_image(width, height, seed)
+            self.assertEqual(index_rows(quantize(img, PALETTE, 'floyd-steinberg')),
+                             sequential_floyd_steinberg(img, PALETTE), (width, height))
+
+if __name__ == "__main__":
+    unittest.main()
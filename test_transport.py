@@ -0,0 +1,136 @@
+import os
+import pty
+import threading
+import time
+import tty
+import unittest
+
+from emulator import ControllerEmulator
+from gcode import shot_block
+from machine import MachineProfile
+from transport import FEED_HOLD, MANUAL, RX_BUFFER_SIZE, SOFT_RESET, STOP_TIMEOUT, SerialTransport
+
+# Longest acceptable time from the stop request to the controller confirming it
+MAX_STOP_LATENCY = 0.1
+
+# Slow enough that a job is still moving when the stop is requested
+SLOW_PROFILE = MachineProfile((1200.0,) * 3, (100.0,) * 3, shot_dwell=0.05)
+
+class EmergencyStopTest(unittest.TestCase):
+    """Emergency stop against the emulated controller."""
+
+    def setUp(self):
+        self.emulator = ControllerEmulator(SLOW_PROFILE)
+        self.transport = SerialTransport.open(self.emulator.start(), 115200)
+
+    def tearDown(self):
+        self.transport.close()
+        self.emulator.stop()
+
+    def start_long_job(self):
+        self.transport.send("G90\nG0 X0 Y0 Z0").result(timeout=STOP_TIMEOUT)
+        for x in range(10, 200, 10):
+            self.transport.send(f"G0 X{x}")
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while not (self.emulator.moving and self.emulator.planner) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(self.emulator.planner)
+
+    def test_stop_latency(self):
+        self.start_long_job()
+        latency = self.transport.emergency_stop().result(timeout=STOP_TIMEOUT)
+        self.assertLess(latency, MAX_STOP_LATENCY)
+        self.assertEqual(self.transport.stop_latency, latency)
+        self.assertFalse(self.emulator.planner)
+        self.assertEqual(self.transport.buffered, 0)
+
+    def test_job_after_stop_unlocks_controller(self):
+        self.start_long_job()
+        self.transport.emergency_stop().result(timeout=STOP_TIMEOUT)
+        self.assertTrue(self.emulator.alarm)
+        # The reset interrupted motion, the next job must not be refused with error:9
+        self.transport.clear_halt()
+        self.assertTrue(self.transport.run_toolpath([(1, 1), (2, 1)], shot_block, retries=0))
+        self.assertFalse(self.emulator.alarm)
+        self.assertEqual(self.emulator.shots[-2:], [(1.0, 1.0, 1.0), (2.0, 1.0, 1.0)])
+
+class UnconfirmedStopTest(unittest.TestCase):
+    """A controller that acknowledges every line but never reports a reset."""
+
+    def setUp(self):
+        self._master, slave = pty.openpty()
+        tty.setraw(slave)
+        self._slave = slave
+        self._running = True
+        threading.Thread(target=self._answer, daemon=True).start()
+        self.transport = SerialTransport.open(os.ttyname(slave), 115200)
+
+    def tearDown(self):
+        self._running = False
+        self.transport.close()
+        os.close(self._slave)
+        os.close(self._master)
+
+    def _answer(self):
+        while self._running:
+            try:
+                data = os.read(self._master, 1024)
+            except OSError:
+                return
+            data = data.replace(FEED_HOLD, b'').replace(SOFT_RESET, b'')
+            os.write(self._master, b'ok\r\n' * data.count(b'\n'))
+
+    def test_stop_times_out_and_transport_keeps_streaming(self):
+        stopped = self.transport.emergency_stop(timeout=0.2)
+        with self.assertRaises(TimeoutError):
+            stopped.result(timeout=STOP_TIMEOUT)
+        self.transport.clear_halt()
+        # More than a receive buffer's worth of lines, so lost acks would block the writer
+        futures = [self.transport.send(f"G0 X{x}") for x in range(2 * RX_BUFFER_SIZE // 6)]
+        self.assertEqual([future.result(timeout=STOP_TIMEOUT) for future in futures], ['ok'] * len(futures))
+
+class SilentControllerTest(unittest.TestCase):
+    """A controller that reads every line and never answers."""
+
+    def setUp(self):
+        self._master, slave = pty.openpty()
+        tty.setraw(slave)
+        self._slave = slave
+        self.received = bytearray()
+        self._running = True
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def tearDown(self):
+        self._running = False
+        self.transport.close()
+        os.close(self._slave)
+        os.close(self._master)
+
+    def _read(self):
+        while self._running:
+            try:
+                self.received += os.read(self._master, 1024)
+            except OSError:
+                return
+
+    def test_timed_out_lines_free_the_buffer(self):
+        self.transport = SerialTransport.open(os.ttyname(self._slave), 115200)
+        # Twice the receive buffer, so the later lines can only go out once earlier ones time out
+        futures = [self.transport.send(f"G0 X{x}", MANUAL, timeout=0.05) for x in range(2 * RX_BUFFER_SIZE // 6)]
+        for future in futures:
+            with self.assertRaises(TimeoutError):
+                future.result(timeout=STOP_TIMEOUT)
+        self.assertEqual(self.transport.buffered, 0)
+        self.assertFalse(self.transport.in_flight)
+
+    def test_without_acks_every_line_is_written(self):
+        self.transport = SerialTransport.open(os.ttyname(self._slave), 115200, acks=False)
+        futures = [self.transport.send(f"{x},{x};") for x in range(100)]
+        self.assertEqual([future.result(timeout=STOP_TIMEOUT) for future in futures], [None] * len(futures))
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while self.received.count(b'\n') < len(futures) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.received.decode().split(), [f"{x},{x};" for x in range(100)])
+
+if __name__ == "__main__":
+    unittest.main()
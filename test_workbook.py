@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import openpyxl
+
+from palette import IndexedImage
+from workbook import COMPLETE_SHEET_TITLE, build_workbook, hex_color, read_layers, read_sheet_names, save_parallel
+
+# Black is written as rgb 00000000, the value openpyxl also uses for "no color"
+PALETTE = [(0, 0, 0), (255, 255, 255), (255, 0, 0), (0, 128, 255), (250, 200, 0)]
+
+# Function to make a width x height image with every palette color, the same one for the same seed
+def random_image(width, height, palette=PALETTE, seed=0):
+    indices = np.random.default_rng(seed).integers(0, len(palette), (height, width), dtype=np.uint8)
+    return IndexedImage(indices, palette)
+
+# Function to read the painted cells of every sheet through openpyxl, {sheet: [(x, y)]} in row-major order
+def openpyxl_layers(path):
+    wb = openpyxl.load_workbook(path)
+    return {ws.title: [(cell.column - 1, cell.row - 1) for row in ws.iter_rows() for cell in row
+                       if cell.fill.fill_type == 'solid']
+            for ws in wb.worksheets}
+
+class LayerReaderTest(unittest.TestCase):
+    """The streaming layer reader against openpyxl and the index map the workbook was made from."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.image = random_image(40, 30)
+        cls.path = os.path.join(cls.directory.name, 'layers.xlsx')
+        build_workbook(cls.image).save(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_matches_openpyxl(self):
+        names = read_sheet_names(self.path)
+        self.assertEqual(read_layers(self.path, names), openpyxl_layers(self.path))
+
+    def test_matches_index_map(self):
+        colors = [hex_color(color) for color in self.image.palette]
+        layers = read_layers(self.path, colors)
+        for color, cells in zip(colors, self.image.layer_cells()):
+            self.assertEqual(layers[color], [tuple(cell) for cell in cells], color)
+        self.assertTrue(layers['000000'])
+
+    def test_complete_image_has_every_cell(self):
+        width, height = self.image.size
+        cells = read_layers(self.path, [COMPLETE_SHEET_TITLE])[COMPLETE_SHEET_TITLE]
+        self.assertEqual(cells, [(x, y) for y in range(height) for x in range(width)])
+
+# Function to describe a workbook through openpyxl: per sheet, every cell's fill color and every
+# column width and row height
+def workbook_contents(path):
+    wb = openpyxl.load_workbook(path)
+    return [(ws.title,
+             {cell.coordinate: (cell.fill.fill_type, cell.fill.start_color.rgb) for row in ws.iter_rows() for cell in row},
+             {key: dimension.width for key, dimension in ws.column_dimensions.items()},
+             {key: dimension.height for key, dimension in ws.row_dimensions.items()})
+            for ws in wb.worksheets]
+
+class ParallelExportTest(unittest.TestCase):
+    """The process-parallel export against the workbook built in one process."""
+
+    def test_matches_serial_export(self):
+        image = random_image(23, 17, seed=1)
+        with tempfile.TemporaryDirectory() as directory:
+            serial_path, parallel_path = os.path.join(directory, 'serial.xlsx'), os.path.join(directory, 'parallel.xlsx')
+            build_workbook(image).save(serial_path)
+            save_parallel(image, parallel_path, processes=2)
+            self.assertEqual(workbook_contents(parallel_path), workbook_contents(serial_path))
+
+if __name__ == "__main__":
+    unittest.main()
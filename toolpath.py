@@ -0,0 +1,142 @@
+import time
+
+# Layers with at most this many cells are refined with nearest neighbor + 2-opt,
+# denser layers keep the serpentine order which is already close to optimal for them
+SPARSE_LAYER_CELLS = 400
+
+# Upper bound on the time spent in 2-opt refinement per layer, in seconds
+TWO_OPT_TIME_LIMIT = 0.5
+
+class ToolpathPlan:
+    """Ordered shot list for one layer with its estimated travel against the row-major order."""
+
+    def __init__(self, order, strategy, travel, baseline_travel):
+        self.order = order
+        self.strategy = strategy
+        self.travel = travel
+        self.baseline_travel = baseline_travel
+
+    @property
+    def saving(self):
+        return self.baseline_travel - self.travel
+
+    @property
+    def saving_ratio(self):
+        return self.saving / self.baseline_travel if self.baseline_travel else 0.0
+
+    def report(self):
+        return (f"{self.strategy}: {len(self.order)} shots, travel {self.travel:.1f} "
+                f"vs {self.baseline_travel:.1f} row by row ({self.saving_ratio:.0%} saved)")
+
+# Travel time between two cells: the X axis and the coupled Y/Z axes move at the same time,
+# so the slower of the two moves sets the duration
+def travel_cost(a, b, x_speed=1.0, y_speed=1.0):
+    return max(abs(a[0] - b[0]) / x_speed, abs(a[1] - b[1]) / y_speed)
+
+# Function to add up the travel of visiting cells in order, starting from `start`
+def path_travel(order, start=(0, 0), x_speed=1.0, y_speed=1.0):
+    total = 0.0
+    previous = start
+    for cell in order:
+        total += travel_cost(previous, cell, x_speed, y_speed)
+        previous = cell
+    return total
+
+# The order every process_layer used so far: row by row, always from column 0
+def row_major(cells):
+    return sorted(cells, key=lambda cell: (cell[1], cell[0]))
+
+# Function to sweep the rows alternately left to right and right to left
+def serpentine(cells):
+    rows = {}
+    for x, y in cells:
+        rows.setdefault(y, []).append(x)
+    order = []
+    for i, y in enumerate(sorted(rows)):
+        xs = sorted(rows[y], reverse=i % 2 == 1)
+        order.extend((x, y) for x in xs)
+    return order
+
+# Function to greedily visit the closest remaining cell next
+def nearest_neighbor(cells, start=(0, 0), x_speed=1.0, y_speed=1.0):
+    remaining = list(cells)
+    order = []
+    current = start
+    while remaining:
+        best = min(range(len(remaining)), key=lambda i: travel_cost(current, remaining[i], x_speed, y_speed))
+        current = remaining[best]
+        remaining[best] = remaining[-1]
+        remaining.pop()
+        order.append(current)
+    return order
+
+# Function to improve an open path by reversing segments while that shortens it
+def two_opt(order, start=(0, 0), x_speed=1.0, y_speed=1.0, time_limit=TWO_OPT_TIME_LIMIT):
+    path = [start] + list(order)
+    cost = lambda a, b: travel_cost(a, b, x_speed, y_speed)
+    deadline = time.monotonic() + time_limit
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for i in range(1, len(path) - 1):
+            a, b = path[i - 1], path[i]
+            removed_ab = cost(a, b)
+            for j in range(i + 1, len(path)):
+                c = path[j]
+                delta = cost(a, c) - removed_ab
+                if j + 1 < len(path):
+                    d = path[j + 1]
+                    delta += cost(b, d) - cost(c, d)
+                if delta < -1e-9:
+                    path[i:j + 1] = reversed(path[i:j + 1])
+                    b = path[i]
+                    removed_ab = cost(a, b)
+                    improved = True
+    return path[1:]
+
+# Function to order a layer's filled cells for the least travel, starting from the machine position
+def plan_toolpath(cells, start=(0, 0), x_speed=1.0, y_speed=1.0):
+    baseline = row_major(cells)
+    baseline_travel = path_travel(baseline, start, x_speed, y_speed)
+
+    order = serpentine(cells)
+    plan = ToolpathPlan(order, 'serpentine', path_travel(order, start, x_speed, y_speed), baseline_travel)
+    if len(cells) <= SPARSE_LAYER_CELLS:
+        order = two_opt(nearest_neighbor(cells, start, x_speed, y_speed), start, x_speed, y_speed)
+        travel = path_travel(order, start, x_speed, y_speed)
+        if travel < plan.travel:
+            plan = ToolpathPlan(order, 'nearest neighbor + 2-opt', travel, baseline_travel)
+    if plan.travel >= baseline_travel:
+        plan = ToolpathPlan(baseline, 'row major', baseline_travel, baseline_travel)
+    return plan
+
+# Function to split a layer into horizontal runs of adjacent cells, returns (x, y, end_x) row by row.
+# A run is shot in one traverse from x to end_x; a lone cell is a run with end_x == x.
+def find_runs(cells):
+    runs = []
+    for x, y in row_major(set(cells)):
+        if runs and runs[-1][1] == y and runs[-1][2] == x - 1:
+            runs[-1] = (runs[-1][0], y, x)
+        else:
+            runs.append((x, y, x))
+    return runs
+
+# Function to greedily visit the closest remaining run next, entering it from whichever end is closer
+def plan_runs(runs, start=(0, 0), x_speed=1.0, y_speed=1.0):
+    remaining = list(runs)
+    order = []
+    current = start
+    while remaining:
+        best, reverse = min(((i, reverse) for i in range(len(remaining)) for reverse in (False, True)),
+                            key=lambda choice: travel_cost(current, _run_entry(remaining[choice[0]], choice[1]),
+                                                           x_speed, y_speed))
+        x, y, end_x = remaining[best]
+        run = (end_x, y, x) if reverse else (x, y, end_x)
+        remaining[best] = remaining[-1]
+        remaining.pop()
+        order.append(run)
+        current = (run[2], y)
+    return order
+
+def _run_entry(run, reverse):
+    return (run[2], run[1]) if reverse else (run[0], run[1])
@@ -0,0 +1,392 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future
+
+import serial
+
+# Size of the controller's serial receive buffer in bytes (128 on an Arduino running GRBL)
+RX_BUFFER_SIZE = 128
+
+# Seconds to wait for the acknowledgement of a line, and for all queued motion to finish
+ACK_TIMEOUT = 10
+MOTION_TIMEOUT = 120
+
+# Number of times a shot rejected by the controller is sent again before the job fails
+SHOT_RETRIES = 2
+
+# Zero-length dwell, acknowledged only once every queued move has completed
+SYNC_COMMAND = "G4 P0"
+
+# Command priorities of the shared serial transport, lower values are sent first
+REALTIME = 0
+MANUAL = 1
+JOB = 2
+
+# Real-time bytes acted on by the controller as soon as they arrive, outside the line buffer
+FEED_HOLD = b'!'
+SOFT_RESET = b'\x18'
+
+# Start of the lines a controller prints once a reset has taken effect
+STOP_REPLIES = ('Grbl', 'ALARM', '[MSG:Reset')
+
+# Seconds to wait for the controller to confirm an emergency stop
+STOP_TIMEOUT = 2
+
+# Clears the alarm lock GRBL enters when a reset interrupts motion
+UNLOCK_COMMAND = "$X"
+
+# Job commands allowed to wait in the queue before the submitting thread blocks
+JOB_QUEUE_SIZE = 64
+
+# Function to describe how an emergency stop ended, for the log
+def stop_report(stopped):
+    if stopped.cancelled():
+        return "Stop not confirmed before the machine was released"
+    if stopped.exception():
+        return f"Stop not confirmed: {stopped.exception()}"
+    return f"Machine stopped after {stopped.result() * 1000:.0f} ms"
+
+class Command:
+    """A queued command: all of its lines are sent back to back and acknowledged as one."""
+
+    def __init__(self, text, priority, timeout=ACK_TIMEOUT, stop_on_error=False):
+        self.lines = [line.strip() for line in text.splitlines() if line.strip()]
+        self.priority = priority
+        self.timeout = timeout  # Seconds the controller may take to acknowledge each line
+        self.stop_on_error = stop_on_error  # Each line waits for the previous ack, a rejection drops the rest
+        self.future = Future()
+        self.pending = len(self.lines)
+        self.response = None
+
+    def acknowledge(self, response):
+        # The first error wins, otherwise the command resolves with its last ack
+        if self.response is None or not self.response.startswith('error'):
+            self.response = response
+        self.pending -= 1
+        if not self.pending and not self.future.done():
+            self.future.set_result(self.response)
+
+    def acknowledged(self, sent):
+        """Whether the first `sent` lines have all been answered."""
+        return self.pending == len(self.lines) - sent
+
+    @property
+    def rejected(self):
+        return self.response is not None and self.response.startswith('error')
+
+    def drop_rest(self):
+        # Lines after a rejected one are never sent, the command resolves with the rejection
+        if not self.future.done():
+            self.future.set_result(self.response)
+
+    def expire(self):
+        if not self.future.done():
+            self.future.set_exception(TimeoutError(f"No response from the controller to '{self.lines[0]}' "
+                                                   f"within {self.timeout}s"))
+
+class SerialTransport:
+    """Single owner of the controller's serial port, shared by the CLI and every GUI.
+
+    An asyncio loop on a background thread runs a writer task, which takes commands
+    from a priority queue and keeps the controller's receive buffer full by counting
+    characters, and a reader task, which matches `ok`/`error` acks to the lines in
+    flight and hands every other line to the listeners. Callers on any thread get a
+    concurrent Future back, so neither a Qt event loop nor the CLI is ever blocked.
+    A command whose line is not acknowledged within its timeout fails with TimeoutError.
+    With `acks=False`, for firmware that never answers, lines are written as soon as they
+    are taken from the queue and their Futures resolve with None once written.
+
+    Priorities only reorder commands still waiting in the queue: a manual jog can
+    overtake queued job commands, never lines already sent to the controller.
+    """
+
+    def __init__(self, ser, buffer_size=RX_BUFFER_SIZE, job_queue_size=JOB_QUEUE_SIZE, acks=True):
+        self.ser = ser
+        self.buffer_size = buffer_size
+        self.acks = acks  # Whether the controller answers every line with ok or error
+        self.in_flight = deque()  # (command, length) of every line not acknowledged yet
+        self.buffered = 0
+        self._last_progress = time.monotonic()  # Last ack, or the first send into an idle controller
+        self.listeners = []  # Callbacks for status, alarm and other non-ack lines
+        self._job_slots = threading.Semaphore(job_queue_size)
+        self._sequence = itertools.count()
+        self._closing = False
+        self._current = None  # Command the writer task is sending
+        self.halted = False  # Set by emergency_stop, job commands are refused until clear_halt
+        self._stop_pending = None  # (press time, Future, timeout handle) of a stop not confirmed yet
+        self.alarm = False  # The controller reported an alarm and locks out G-code until unlocked
+        self.stop_latency = None  # Seconds from the last stop request to the controller confirming it
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    @classmethod
+    def open(cls, port, baud_rate, **kwargs):
+        # The read timeout lets the reader task notice a close request
+        return cls(serial.Serial(port, baud_rate, timeout=0.1), **kwargs)
+
+    def isOpen(self):
+        return not self._closing and self.ser.isOpen()
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def send(self, command, priority=JOB, timeout=ACK_TIMEOUT, stop_on_error=False):
+        """Queue a command from any thread, returns a Future resolved with its ack.
+
+        Job commands block the calling thread while the job queue is full. With `stop_on_error`
+        each line of the command is only sent once the previous one was accepted, so the
+        shot after a rejected move is never fired.
+        """
+        if priority == JOB:
+            self._job_slots.acquire()
+        queued = Command(command, priority, timeout, stop_on_error)
+        self.loop.call_soon_threadsafe(self._enqueue, queued)
+        return queued.future
+
+    async def send_async(self, command, priority=JOB, timeout=ACK_TIMEOUT, stop_on_error=False):
+        """Coroutine version of send for code running on the transport's loop."""
+        if priority == JOB:
+            await self.loop.run_in_executor(None, self._job_slots.acquire)
+        queued = Command(command, priority, timeout, stop_on_error)
+        self._enqueue(queued)
+        return await asyncio.wrap_future(queued.future)
+
+    def sync(self, priority=JOB):
+        """Queue a motion-complete check, returns a Future resolved once every move before it has finished."""
+        return self.send(SYNC_COMMAND, priority, MOTION_TIMEOUT)
+
+    def realtime(self, data):
+        """Write real-time bytes (feed hold, reset, status query) ahead of everything queued."""
+        self.loop.call_soon_threadsafe(self._write, data)
+
+    def emergency_stop(self, timeout=STOP_TIMEOUT):
+        """Halt the machine now, skipping every queued and buffered command.
+
+        Feed hold and soft reset are written ahead of anything else. Returns a Future
+        resolved with the stop latency in seconds, measured from this call until the
+        controller reports the reset; the same value is kept in `stop_latency`.
+        The Future fails with TimeoutError if no confirmation comes within `timeout`.
+        """
+        pressed = time.perf_counter()
+        self.halted = True
+        stopped = Future()
+        self.loop.call_soon_threadsafe(self._emergency_stop, pressed, stopped, timeout)
+        return stopped
+
+    def clear_halt(self):
+        """Accept job commands again after an emergency stop, unlocking the controller first if needed."""
+        # Runs on the loop, so it takes effect before any command sent after this call
+        self.loop.call_soon_threadsafe(self._clear_halt)
+
+    def _emergency_stop(self, pressed, stopped, timeout):
+        self._write(FEED_HOLD + SOFT_RESET)
+        self._end_stop_wait()
+        self._stop_pending = (pressed, stopped, self.loop.call_later(timeout, self._stop_timed_out, stopped))
+
+        # Nothing sent or queued will be acknowledged to its caller. Lines already sent stay in
+        # flight until the reset is confirmed: a controller that has not reset yet still answers them.
+        self._writer_task.cancel()
+        if self._current:
+            self._current.future.cancel()
+        while not self._queue.empty():
+            priority, _, command = self._queue.get_nowait()
+            if priority == JOB:
+                self._job_slots.release()
+            command.future.cancel()
+        for command, _ in self.in_flight:
+            command.future.cancel()
+        self._writer_task = self.loop.create_task(self._writer())
+
+    def _stop_timed_out(self, stopped):
+        if self._stop_pending and self._stop_pending[1] is stopped:
+            self._stop_pending = None
+            stopped.set_exception(TimeoutError("The controller did not confirm the stop"))
+
+    def _end_stop_wait(self):
+        # A stop superseded by a new one, or by clear_halt, is no longer waited for
+        if self._stop_pending:
+            _, stopped, timer = self._stop_pending
+            self._stop_pending = None
+            timer.cancel()
+            stopped.cancel()
+
+    def _clear_halt(self):
+        self._end_stop_wait()
+        if self.alarm:
+            # Queued ahead of everything, the controller processes lines in order so the job follows it
+            self.alarm = False
+            self._enqueue(Command(UNLOCK_COMMAND, REALTIME))
+        self.halted = False
+
+    def close(self):
+        self._closing = True
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.ser.close()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self._queue = asyncio.PriorityQueue()
+        self._room = asyncio.Condition()
+        self._writer_task = self.loop.create_task(self._writer())
+        self.loop.create_task(self._reader())
+        self.loop.call_soon(self._ready.set)
+        self.loop.run_forever()
+        # close() stopped the loop, let the tasks unwind before closing it
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def _enqueue(self, command):
+        # Runs on the loop, so a job command can never slip in behind an emergency stop's flush
+        if command.priority == JOB and self.halted:
+            self._job_slots.release()
+            command.future.cancel()
+            return
+        self._queue.put_nowait((command.priority, next(self._sequence), command))
+
+    def _write(self, data):
+        self.ser.write(data)
+        self.ser.flush()
+
+    async def _writer(self):
+        while True:
+            priority, _, command = await self._queue.get()
+            if priority == JOB:
+                self._job_slots.release()
+            self._current = command
+            if not command.lines:
+                if not command.future.done():
+                    command.future.set_result(None)
+                continue
+            for sent, line in enumerate(command.lines):
+                data = f"{line}\n".encode('utf-8')
+                if not self.acks:
+                    self._write(data)
+                    continue
+                if len(data) > self.buffer_size:
+                    if not command.future.done():
+                        command.future.set_exception(ValueError(f"Command longer than the controller buffer: {line}"))
+                    break
+                if command.stop_on_error and sent:
+                    async with self._room:
+                        await self._room.wait_for(lambda: command.acknowledged(sent) or command.future.done())
+                    if command.rejected or command.future.done():
+                        command.drop_rest()
+                        break
+                async with self._room:
+                    await self._room.wait_for(lambda: self.buffered + len(data) <= self.buffer_size)
+                    self.buffered += len(data)
+                if not self.in_flight:
+                    self._last_progress = time.monotonic()
+                self.in_flight.append((command, len(data)))
+                self._write(data)
+            if not self.acks and not command.future.done():
+                command.future.set_result(None)
+            self._current = None
+
+    async def _reader(self):
+        while not self._closing:
+            try:
+                raw = await self.loop.run_in_executor(None, self.ser.readline)
+            except RuntimeError:
+                return  # The interpreter is shutting down without close() having been called
+            response = raw.decode('utf-8', errors='replace').strip()
+            self._expire_stalled()
+            if not response:
+                continue
+            if response.startswith('ALARM') or "'$X'" in response:
+                self.alarm = True
+            if self._stop_pending and response.startswith(STOP_REPLIES):
+                pressed, stopped, timer = self._stop_pending
+                self._stop_pending = None
+                timer.cancel()
+                self.stop_latency = time.perf_counter() - pressed
+                stopped.set_result(self.stop_latency)
+                # The reset emptied the controller's buffer, the lines still in flight will never be answered
+                async with self._room:
+                    self.in_flight.clear()
+                    self.buffered = 0
+                    self._room.notify_all()
+            if response != 'ok' and not response.startswith('error'):
+                for listener in self.listeners:
+                    listener(response)
+                continue
+            if not self.in_flight:
+                continue  # Ack for a line sent before the transport took over the port
+            command, length = self.in_flight.popleft()
+            self._last_progress = time.monotonic()
+            async with self._room:
+                self.buffered -= length
+                command.acknowledge(response)
+                self._room.notify_all()
+
+    def _expire_stalled(self):
+        # Acks come back in order, so only the oldest line in flight can be late. It gets its
+        # command's timeout from the last ack; a sync waits for motion and has a longer one.
+        # A late line is given up: its command fails and its bytes are freed for the lines behind it.
+        if not self.in_flight:
+            return
+        command, length = self.in_flight[0]
+        if time.monotonic() - self._last_progress <= command.timeout:
+            return
+        self.in_flight.popleft()
+        self.buffered -= length
+        self._last_progress = time.monotonic()  # The next line gets its own timeout
+        command.expire()
+        self.loop.create_task(self._wake_writer())  # It may be waiting for room or for this command's ack
+
+    async def _wake_writer(self):
+        async with self._room:
+            self._room.notify_all()
+
+    def run_toolpath(self, order, shot_commands, retries=SHOT_RETRIES, is_running=lambda: True, on_shot=None):
+        """Queue every shot as a job command, paced by the queue's back-pressure and the acks.
+
+        `shot_commands(*order[i])` returns the G-code for one shot, or one burst when the entries
+        are runs (x, y, end_x). A shot only fires once its move was accepted; a rejected shot,
+        move or fire, is queued again up to `retries` times, and as moves are absolute it still
+        lands on its own cell and fires once.
+        Returns False if the job was stopped before every shot was sent.
+        """
+        pending = deque(range(len(order)))
+        attempts = [0] * len(order)
+        failures = []
+
+        def shot_done(index, future):
+            if future.cancelled():  # Dropped by an emergency stop
+                return
+            if future.exception():
+                failures.append(str(future.exception()))
+                return
+            response = future.result()
+            if response is None or not response.startswith('error'):
+                if on_shot:
+                    on_shot(index, order[index])
+            elif attempts[index] < retries:
+                attempts[index] += 1
+                pending.append(index)
+            else:
+                failures.append(f"Shot at X{order[index][0]} Y{order[index][1]} failed: {response}")
+
+        while pending and is_running():
+            while pending and is_running():
+                index = pending.popleft()
+                future = self.send(shot_commands(*order[index]), JOB, stop_on_error=True)
+                future.add_done_callback(lambda future, index=index: shot_done(index, future))
+            # Acked once every queued move has completed, by then every shot above has resolved
+            try:
+                self.sync().result(timeout=MOTION_TIMEOUT)
+            except CancelledError:
+                return False
+            if failures:
+                raise RuntimeError(failures[0])
+        return not pending
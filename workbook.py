@@ -0,0 +1,278 @@
+import io
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import groupby, repeat
+from multiprocessing import shared_memory
+from xml.etree import ElementTree
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import coordinate_to_tuple
+
+COMPLETE_SHEET_TITLE = "Complete Image"
+
+# Number of parsed layers kept in memory by cached_layer_cells
+LAYER_CACHE_SIZE = 32
+
+# Palettes with at least this many colors are exported with one process per sheet
+PARALLEL_MIN_COLORS = 4
+# ...when the grid also has this many cells: starting the pool costs about 0.25 s, which a
+# 100x100 grid already takes to export serially on two cores
+PARALLEL_MIN_CELLS = 10000
+
+# XML namespaces of the xlsx parts read by the fast layer reader
+SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# Function to convert an RGB value into an Excel fill color
+def rgb_to_fill(rgb):
+    return PatternFill(start_color=rgb, end_color=rgb, fill_type='solid')
+
+# Function to format an (r, g, b) tuple as the hex string used for fills and sheet titles
+def hex_color(color):
+    return ''.join([f'{value:02X}' for value in color])
+
+# Function to size every grid cell of a sheet once per column and once per row
+def set_grid_dimensions(ws, width, height):
+    for x in range(1, width + 1):
+        ws.column_dimensions[get_column_letter(x)].width = 3
+    for y in range(1, height + 1):
+        ws.row_dimensions[y].height = 20
+
+# Function to build the pixel art workbook: a complete image sheet plus one sheet per palette color
+def build_workbook(img_indexed, write_only=True):
+    hex_colors = [hex_color(color) for color in img_indexed.palette]
+    layer_cells = img_indexed.layer_cells()
+    if write_only:
+        return _build_streaming(img_indexed, hex_colors, layer_cells)
+
+    # One fill object per palette color, shared by every cell of that color
+    fills = [rgb_to_fill(color) for color in hex_colors]
+    wb = openpyxl.Workbook()
+    complete_sheet = wb.active
+    complete_sheet.title = COMPLETE_SHEET_TITLE
+    for fill, cells in zip(fills, layer_cells):
+        for x, y in cells:
+            complete_sheet.cell(row=y + 1, column=x + 1).fill = fill
+    set_grid_dimensions(complete_sheet, *img_indexed.size)
+
+    for color, fill, cells in zip(hex_colors, fills, layer_cells):
+        ws = wb.create_sheet(title=color)
+        for x, y in cells:
+            ws.cell(row=y + 1, column=x + 1).fill = fill
+        set_grid_dimensions(ws, *img_indexed.size)
+    return wb
+
+# Write-only export: rows are streamed to disk as they are appended, so memory stays flat
+def _build_streaming(img_indexed, hex_colors, layer_cells):
+    width, height = img_indexed.size
+    fills = [rgb_to_fill(color) for color in hex_colors]
+    wb = openpyxl.Workbook(write_only=True)
+    _register_styles(wb, fills)
+
+    # Dimensions have to be set before the first row is appended in write-only mode
+    complete_sheet = wb.create_sheet(title=COMPLETE_SHEET_TITLE)
+    set_grid_dimensions(complete_sheet, width, height)
+    styled = _styled_cells(complete_sheet, fills)
+    for row in img_indexed.rows():
+        complete_sheet.append([styled[value] for value in row])
+
+    for color, fill, cells in zip(hex_colors, fills, layer_cells):
+        ws = wb.create_sheet(title=color)
+        set_grid_dimensions(ws, width, height)
+        styled_cell = _styled_cells(ws, [fill])[0]
+        rows = {y: [x for x, _ in row_cells] for y, row_cells in groupby(cells, key=lambda cell: cell[1])}
+        for y in range(height):
+            row = [None] * width
+            for x in rows.get(y, ()):
+                row[x] = styled_cell
+            ws.append(row)
+    return wb
+
+# Function to register one cell style per fill, in palette order. Workbooks built from the same
+# palette then share their style ids, whichever colors their sheets happen to write first.
+def _register_styles(wb, fills):
+    for fill in fills:
+        style = StyleArray()
+        style.fillId = wb._fills.add(fill)
+        wb._cell_styles.add(style)
+
+# One styled cell per color: openpyxl re-positions a cell object each time it is appended,
+# so a single instance can stand in for every cell of that color in the sheet
+def _styled_cells(ws, fills):
+    cells = []
+    for fill in fills:
+        cell = WriteOnlyCell(ws)
+        cell.fill = fill
+        cells.append(cell)
+    return cells
+
+# Function to export an indexed image as a layer workbook.
+# Large images with large palettes are exported in parallel when more than one core is available,
+# `processes=1` forces one process.
+def save_pixel_art(img_indexed, path, write_only=True, processes=None):
+    processes = processes or os.cpu_count() or 1
+    width, height = img_indexed.size
+    if (write_only and processes > 1 and len(img_indexed.palette) >= PARALLEL_MIN_COLORS
+            and width * height >= PARALLEL_MIN_CELLS):
+        save_parallel(img_indexed, path, processes)
+        return
+    wb = build_workbook(img_indexed, write_only)
+    wb.save(path)
+
+# Function to export the workbook with the complete image sheet and every layer sheet built in
+# their own process. The index map is handed to the workers through shared memory; each worker
+# returns its finished sheet XML, which is put into a workbook skeleton holding the shared styles.
+def save_parallel(img_indexed, path, processes=None):
+    width, height = img_indexed.size
+    hex_colors = [hex_color(color) for color in img_indexed.palette]
+    index_map = shared_memory.SharedMemory(create=True, size=max(width * height, 1))
+    try:
+        for y, row in enumerate(img_indexed.indices):
+            index_map.buf[y * width:(y + 1) * width] = bytes(row)
+        layers = [None] + list(range(len(hex_colors)))  # None is the complete image
+        with ProcessPoolExecutor(processes) as pool:
+            parts = list(pool.map(_render_sheet, repeat(index_map.name), repeat((width, height)),
+                                  repeat(hex_colors), layers))
+    finally:
+        index_map.close()
+        index_map.unlink()
+
+    # The skeleton has every sheet, empty, and registers the styles in the same order as the workers
+    wb = openpyxl.Workbook(write_only=True)
+    _register_styles(wb, [rgb_to_fill(color) for color in hex_colors])
+    for title in [COMPLETE_SHEET_TITLE] + hex_colors:
+        wb.create_sheet(title=title)
+    skeleton = io.BytesIO()
+    wb.save(skeleton)
+
+    with zipfile.ZipFile(skeleton) as source, zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as target:
+        sheet_parts = dict(zip(_sheet_paths(source).values(), parts))
+        for item in source.infolist():
+            target.writestr(item, sheet_parts.get(item.filename) or source.read(item.filename))
+
+# Process pool worker: build one sheet from the shared index map, returns the sheet's XML
+def _render_sheet(index_map_name, size, hex_colors, layer):
+    width, height = size
+    index_map = shared_memory.SharedMemory(name=index_map_name)
+    try:
+        wb = openpyxl.Workbook(write_only=True)
+        fills = [rgb_to_fill(color) for color in hex_colors]
+        _register_styles(wb, fills)
+        ws = wb.create_sheet(title=COMPLETE_SHEET_TITLE if layer is None else hex_colors[layer])
+        set_grid_dimensions(ws, width, height)
+        styled = _styled_cells(ws, fills)
+        for y in range(height):
+            # A view into the shared block, the row is never copied into this process
+            with index_map.buf[y * width:(y + 1) * width] as row:
+                if layer is None:
+                    ws.append([styled[value] for value in row])
+                else:
+                    ws.append([styled[layer] if value == layer else None for value in row])
+        part = io.BytesIO()
+        wb.save(part)
+    finally:
+        index_map.close()
+    with zipfile.ZipFile(part) as archive:
+        return archive.read(_sheet_paths(archive)[ws.title])
+
+# Function to read the filled cells of one layer without loading the workbook through openpyxl.
+# styles.xml is parsed once to find which cell styles carry a fill, then the sheet XML is
+# streamed and only each cell's style id is checked. Returns (x, y) cells in row-major order.
+def read_layer_cells(path, sheet_name, max_row=None, max_col=None):
+    return read_layers(path, [sheet_name], max_row, max_col)[sheet_name]
+
+# Function to read several layers with a single pass over the archive and its styles
+def read_layers(path, sheet_names, max_row=None, max_col=None):
+    with zipfile.ZipFile(path) as archive:
+        sheet_paths = _sheet_paths(archive)
+        filled_styles = _filled_styles(archive)
+        return {name: _read_sheet_cells(archive, sheet_paths[name], filled_styles, max_row, max_col)
+                for name in sheet_names}
+
+def _read_sheet_cells(archive, sheet_path, filled_styles, max_row, max_col):
+    cells = []
+    row = col = 0
+    with archive.open(sheet_path) as stream:
+        for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                if element.tag == SHEET_NS + 'row':
+                    row = int(element.get('r', row + 1))
+                    col = 0
+                    if max_row is not None and row > max_row:
+                        break
+                continue
+            if element.tag == SHEET_NS + 'c':
+                ref = element.get('r')
+                col = coordinate_to_tuple(ref)[1] if ref else col + 1
+                style = int(element.get('s', 0))
+                if style < len(filled_styles) and filled_styles[style] and (max_col is None or col <= max_col):
+                    cells.append((col - 1, row - 1))
+                element.clear()
+            elif element.tag == SHEET_NS + 'row':
+                element.clear()
+    return cells
+
+# Function to list the sheet names of a workbook by reading only its manifest
+def read_sheet_names(path):
+    with zipfile.ZipFile(path) as archive:
+        workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    return [sheet.get('name') for sheet in workbook.iter(SHEET_NS + 'sheet')]
+
+# Cached read_layer_cells: a layer is parsed again only when the file's mtime changes
+def cached_layer_cells(path, sheet_name, max_row=None, max_col=None):
+    path = os.path.abspath(path)
+    cells = _parsed_layer(path, os.stat(path).st_mtime_ns, sheet_name)
+    return [(x, y) for x, y in cells
+            if (max_row is None or y < max_row) and (max_col is None or x < max_col)]
+
+# Parsed layers keyed by (path, mtime, sheet), least recently used entries are evicted first
+@lru_cache(maxsize=LAYER_CACHE_SIZE)
+def _parsed_layer(path, mtime, sheet_name):
+    return tuple(read_layer_cells(path, sheet_name))
+
+# Function to map sheet names to their XML part inside the xlsx archive
+def _sheet_paths(archive):
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    rels = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    targets = {rel.get('Id'): rel.get('Target') for rel in rels.iter(PACKAGE_REL_NS + 'Relationship')}
+    paths = {}
+    for sheet in workbook.iter(SHEET_NS + 'sheet'):
+        target = targets[sheet.get(REL_NS + 'id')]
+        paths[sheet.get('name')] = target.lstrip('/') if target.startswith('/') else 'xl/' + target
+    return paths
+
+# Function to flag, for every cell style id, whether cells using it have a fill
+def _filled_styles(archive):
+    styles = ElementTree.fromstring(archive.read('xl/styles.xml'))
+    fills = styles.find(SHEET_NS + 'fills')
+    cell_xfs = styles.find(SHEET_NS + 'cellXfs')
+    if fills is None or cell_xfs is None:
+        return []
+    fills = [_has_fill_color(fill) for fill in fills.iter(SHEET_NS + 'fill')]
+    return [fills[int(xf.get('fillId', 0))] for xf in cell_xfs.iter(SHEET_NS + 'xf')]
+
+# Function to tell whether a raw <fill> element paints its cells. Solid fills, as written by
+# this module, always do: black is stored as rgb 00000000, the same value as "no color".
+# Other patterns count when they carry a color, like the GUIs' `start_color.index` check.
+def _has_fill_color(fill):
+    pattern = fill.find(SHEET_NS + 'patternFill')
+    if pattern is None:
+        return False
+    if pattern.get('patternType') == 'solid':
+        return True
+    color = pattern.find(SHEET_NS + 'fgColor')
+    if color is None:
+        return False
+    if any(color.get(key) is not None for key in ('indexed', 'theme', 'auto')):
+        return True
+    rgb = color.get('rgb', '00000000').upper()
+    if len(rgb) == 6:
+        rgb = '00' + rgb
+    return rgb != '00000000'